@@ -1,18 +1,38 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, session
-import openai
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, Response, stream_with_context
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 from elevenlabs import generate, set_api_key
-import glob
 import re
 from apscheduler.schedulers.background import BackgroundScheduler
-import dateparser
-from rapidfuzz import fuzz, process
-import shutil
+import hashlib
+from urllib.parse import urlencode
+import itertools
+import threading
+from research_index import ResearchIndex
+from tts_pipeline import SpeechPipeline, ElevenLabsBackend, FakeTTSBackend
+from transcriber import TranscriptionWorker
+from live_transcription import LiveTranscriber
+from conversation_store import ConversationStore
+from health_store import HealthStore
+from daily_logs import DailyLogs, parse_log_range
+from search_index import SearchIndex
+from family_registry import FamilyRegistry, profile_filename
+from prompt_builder import PromptBuilder
+from ingestion import IngestionQueue
+from extraction import Extractor, ExtractionError
+from summarizer import MapReduceSummarizer
+from audio_cache import AudioCache
+from audio_jobs import AudioJobQueue, AudioJobStore
+from health_matcher import HealthMatcher, FUZZY_THRESHOLD, refresh_matcher
+import metrics
+import documents
+from locks import LeaderLock, file_lock
+from response_cache import ResponseCache, canned_questions, references_conversation
+from retention import Retention, default_policies, summarize as summarize_retention
 
 # Load environment variables
 load_dotenv()
@@ -32,37 +52,109 @@ app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "moira_default_secret")
 
 # Configure file paths
-MEMORY_FILE = "memory/memory.json"
+MEMORY_FILE = "memory/memory.json"  # legacy format, migrated into CONVERSATION_DB once
+CONVERSATION_DB = "memory/conversations.db"
+HISTORY_TURNS = 5  # conversation pairs sent to the model with each question
+# Raw turns kept in the database; older ones are folded into a rolling summary and archived in batches
+HOT_TURNS = int(os.getenv("MOIRA_HOT_TURNS", "40"))
+COMPACT_BATCH = int(os.getenv("MOIRA_COMPACT_BATCH", "20"))
+ARCHIVE_DIR = "memory/archive"
+COMPACTION_LOCK_FILE = "memory/.compaction.lock"
+# Held by the one worker process that runs scheduled jobs and startup ingestion
+LEADER_LOCK_FILE = "memory/.leader.lock"
+RETENTION_LOCK_FILE = "memory/.retention.lock"
+LOG_SUMMARIES = os.getenv("MOIRA_LOG_SUMMARIES", "0") == "1"  # cache a GPT summary per finished day
+MAX_RECALL_CHARS = 6000
 RESEARCH_DIR = "research"
 LOGS_DIR = "logs"
 DOCUMENTS_DIR = "documents"
+# Legacy health files, migrated into HEALTH_DB once
 HEALTH_BUFFER_FILE = os.path.join(DOCUMENTS_DIR, 'health_buffer.json')
 HEALTH_RECORDS_FILE = os.path.join(DOCUMENTS_DIR, 'health_records.json')
+HEALTH_DB = "memory/health.db"
+SEARCH_DB = "memory/search.db"
+AUDIO_JOBS_DB = "memory/audio_jobs.db"  # job status shared by the worker processes
 FAMILY_DIR = 'family'
+HEALTH_VOCABULARY_FILE = os.path.join('config', 'health_vocabulary.json')
 PROCESSED_DIR = os.path.join(RESEARCH_DIR, "processed")
 SUMMARY_FILE = os.path.join(RESEARCH_DIR, "summarized_knowledge.json")
+RESEARCH_INDEX_FILE = os.path.join(RESEARCH_DIR, "research_index.json")
+INGEST_MANIFEST_FILE = os.path.join(RESEARCH_DIR, "ingest_manifest.json")
+CHUNK_SUMMARY_DB = os.path.join(RESEARCH_DIR, "chunk_summaries.db")
+TEXT_CACHE_DIR = os.path.join(RESEARCH_DIR, "text_cache")
+
+# Retrieval settings for research passages sent with each question
+RESEARCH_TOP_K = int(os.getenv("MOIRA_RESEARCH_TOP_K", "5"))
+RESEARCH_TOKEN_BUDGET = int(os.getenv("MOIRA_RESEARCH_TOKEN_BUDGET", "1200"))
+RESEARCH_INDEX_SAVE_SECONDS = int(os.getenv("MOIRA_RESEARCH_INDEX_SAVE_SECONDS", "60"))
+
+# Opt-in cache of answers to repeated questions (MOIRA_RESPONSE_CACHE=1), shared by the worker processes
+RESPONSE_CACHE_DB = "memory/response_cache.db"
+RESPONSE_CACHE_WARM_LOCK_FILE = "memory/.response_cache_warm.lock"
+if os.getenv("MOIRA_RESPONSE_CACHE", "0") == "1":
+    response_cache = ResponseCache(
+        RESPONSE_CACHE_DB,
+        ttl=int(os.getenv("MOIRA_RESPONSE_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("MOIRA_RESPONSE_CACHE_SIZE", "256"))
+    )
+else:
+    response_cache = None
+response_cache_warming = threading.Lock()
+
+# Requests slower than this are logged with their per-stage breakdown (0 disables)
+metrics.configure(slow_request_ms=int(os.getenv("MOIRA_SLOW_REQUEST_MS", "0")))
 
 # Ensure directories exist
 os.makedirs("memory", exist_ok=True)
 os.makedirs("research", exist_ok=True)
-os.makedirs("static/audio", exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 os.makedirs(DOCUMENTS_DIR, exist_ok=True)
-os.makedirs(FAMILY_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
-# Ensure health files exist
-if not os.path.exists(HEALTH_BUFFER_FILE):
-    with open(HEALTH_BUFFER_FILE, 'w') as f:
-        json.dump([], f)
-if not os.path.exists(HEALTH_RECORDS_FILE):
-    with open(HEALTH_RECORDS_FILE, 'w') as f:
-        json.dump([], f)
+research_index = ResearchIndex(RESEARCH_INDEX_FILE)
+conversations = ConversationStore(CONVERSATION_DB, legacy_file=MEMORY_FILE)
+family_registry = FamilyRegistry(FAMILY_DIR, on_change=lambda: family_changed())
+health_store = HealthStore(HEALTH_DB, legacy_buffer=HEALTH_BUFFER_FILE, legacy_records=HEALTH_RECORDS_FILE)
+# Turns, health notes and profiles are indexed as they change; sync_search_index catches up on anything missed
+search_index = SearchIndex(SEARCH_DB)
 
 # Add this near the top, after other config variables
 VOICE_ID = "8N2ng9i2uiUWqstgmWlH"  # Moira's original voice from OLDFILES
+TTS_MODEL = "eleven_flash_v2"
 
-daily_log = []
+# Sentence-level speech synthesis for streamed replies (MOIRA_TTS_BACKEND=fake runs without ElevenLabs)
+if os.getenv("MOIRA_TTS_BACKEND", "elevenlabs") == "fake":
+    tts_backend = FakeTTSBackend(latency=float(os.getenv("MOIRA_FAKE_TTS_LATENCY", "0.2")))
+else:
+    tts_backend = ElevenLabsBackend(VOICE_ID, TTS_MODEL)
+
+# Synthesized speech is cached by text + voice + model; eviction runs in the background
+AUDIO_DIR = "static/audio"
+audio_cache = AudioCache(
+    AUDIO_DIR,
+    max_bytes=int(os.getenv("MOIRA_AUDIO_CACHE_MB", "200")) * 1024 * 1024,
+    max_files=int(os.getenv("MOIRA_AUDIO_CACHE_FILES", "500"))
+)
+audio_job_store = AudioJobStore(AUDIO_JOBS_DB)
+audio_jobs = AudioJobQueue(lambda text: generate_audio(text), audio_job_store,
+                           workers=int(os.getenv("MOIRA_AUDIO_WORKERS", "2")))
+speech_pipeline = SpeechPipeline(tts_backend, max_workers=int(os.getenv("MOIRA_TTS_CONCURRENCY", "3")),
+                                 cache=audio_cache, store=audio_job_store)
+
+# Local Whisper is loaded once at startup and shared by all transcription requests
+TRANSCRIBE_TIMEOUT = int(os.getenv("MOIRA_TRANSCRIBE_TIMEOUT", "120"))
+WHISPER_API_FALLBACK = os.getenv("MOIRA_WHISPER_API_FALLBACK", "1") == "1"
+transcription_worker = TranscriptionWorker(
+    model_size=os.getenv("MOIRA_WHISPER_MODEL", "base"),
+    concurrency=int(os.getenv("MOIRA_WHISPER_CONCURRENCY", "1")),
+    use_process=os.getenv("MOIRA_WHISPER_PROCESS", "0") == "1"
+)
+# Press-to-talk uploads audio while recording; finished phrases are transcribed before the button is released
+live_transcriber = LiveTranscriber(
+    transcription_worker,
+    threshold=float(os.getenv("MOIRA_VAD_THRESHOLD", "0.01")),
+    silence_ms=int(os.getenv("MOIRA_VAD_SILENCE_MS", "500"))
+)
 
 CHARACTER_TEMPLATE = {
     'name': '',
@@ -76,46 +168,94 @@ CHARACTER_TEMPLATE = {
 }
 
 def append_to_daily_log(entry):
-    global daily_log
-    daily_log.append(entry)
+    daily_logs.append(entry)
 
-def write_daily_log():
-    global daily_log
-    if not daily_log:
-        return
-    date_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    filename = os.path.join(LOGS_DIR, f"{date_str}.txt")
-    with open(filename, 'a', encoding='utf-8') as f:
-        for entry in daily_log:
-            f.write(f"[{entry['timestamp']}] User: {entry['user']}\n")
-            f.write(f"[{entry['timestamp']}] Moira: {entry['assistant']}\n\n")
-    daily_log = []
-
-def load_memory():
+def summarize_log(text):
+    with metrics.span('log_summary', upstream='openai'):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "Summarize this day's conversation log between a parent and Moira. Keep names, health concerns, decisions and plans. Be brief and gentle."},
+                {"role": "user", "content": text[-12000:]}
+            ],
+            max_tokens=300
+        )
+    metrics.record_tokens(getattr(response, 'usage', None), 'log_summary')
+    return response.choices[0].message.content.strip()
+
+daily_logs = DailyLogs(LOGS_DIR, summarize=summarize_log if LOG_SUMMARIES else None)
+
+def load_history():
+    return conversations.recent(HISTORY_TURNS)
+
+def summarize_turns(turns):
+    transcript = "\n\n".join(f"[{t['timestamp']}] User: {t['user']}\nMoira: {t['assistant']}" for t in turns)
+    with metrics.span('conversation_summary', upstream='openai'):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "Summarize these conversation turns between a parent and Moira. Keep names, dates, health concerns, decisions and plans. Be brief."},
+                {"role": "user", "content": transcript[-12000:]}
+            ],
+            max_tokens=300
+        )
+    metrics.record_tokens(getattr(response, 'usage', None), 'conversation_summary')
+    return response.choices[0].message.content.strip()
+
+def fold_summary(previous, summary):
+    # The long-term summary stays roughly constant in size: older detail is condensed as new batches arrive
+    if not previous:
+        return summary
+    with metrics.span('conversation_summary', upstream='openai'):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "Merge the long-term summary with the newer summary into one summary of at most 250 words. Keep names, ongoing health concerns, preferences and open plans; drop resolved small talk."},
+                {"role": "user", "content": f"Long-term summary:\n{previous}\n\nNewer conversations:\n{summary}"}
+            ],
+            max_tokens=400
+        )
+    metrics.record_tokens(getattr(response, 'usage', None), 'conversation_summary')
+    return response.choices[0].message.content.strip()
+
+compaction_lock = threading.Lock()
+
+def compact_conversations():
+    # Fold turns beyond the hot set into the rolling summary and move them to dated archive segments
+    if not compaction_lock.acquire(blocking=False):
+        return 0
+    archived = 0
     try:
-        with open(MEMORY_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"conversations": []}
+        with file_lock(COMPACTION_LOCK_FILE, blocking=False) as locked:
+            if locked:
+                archived = compact_batches()
+    finally:
+        compaction_lock.release()
+    if archived:
+        # The long-term summary changed, so canned answers are keyed afresh
+        start_response_cache_warm()
+    return archived
 
-def save_memory(memory):
-    with open(MEMORY_FILE, 'w') as f:
-        json.dump(memory, f, indent=2)
+def compact_batches():
+    archived = 0
+    try:
+        while True:
+            turns = conversations.compactable(HOT_TURNS, COMPACT_BATCH)
+            if not turns:
+                break
+            summary = summarize_turns(turns)
+            rolling = fold_summary(conversations.long_term_summary(), summary)
+            segment = conversations.archive(turns, summary, rolling, ARCHIVE_DIR)
+            archived += len(turns)
+            print(f"[Moira] Archived {len(turns)} conversation turns to {segment}")
+    except Exception as e:
+        print(f"[Moira] Conversation compaction failed: {e}")
+    return archived
 
 def get_timestamp():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def load_research_snippets():
-    snippets = []
-    for filename in glob.glob(os.path.join(RESEARCH_DIR, "*.txt")):
-        with open(filename, 'r') as f:
-            snippets.append(f.read().strip())
-    return snippets
-
-def ask_moira(user_input, memory):
-    # Construct the conversation history
-    messages = [
-        {"role": "system", "content": '''You are Moira, a highly intelligent and sophisticated AI assistant with a Scottish accent. 
+MOIRA_SYSTEM_PROMPT = '''You are Moira, a highly intelligent and sophisticated AI assistant with a Scottish accent. 
          You are a calm, nurturing, and deeply compassionate companion, especially in the face of chaos, stress, or hostility. Your primary role is to be a supportive, steady, and non-judgmental presence for families living with autism, always offering warmth, understanding, and practical, research-backed advice.
          
          RULES (never break these):
@@ -134,35 +274,98 @@ def ask_moira(user_input, memory):
          - You have access to various research materials that inform your knowledge the user may refer to as a database or a research library. 
          - Special numbers if required : Alcohol & Drug Information & Referral Service This service is available to people across BC needing help with any kind of substance abuse issues 24 hours a day. It provides information and referral to education, prevention and treatment services and regulatory agencies, Toll-free: 1-800-663-1441.
          - Special numbers if required : Kids Help Phone Immediate and caring support, information and, if necessary, referral to a local community or social service agency Toll-free: 1-800-668-6868.
-         - Users can send you voice messages using a press-to-talk button. If a user asks if you can hear them, or says something like 'Hello Moira, can you hear me?', respond warmly and let them know you received their voice message and are ready to help.'''}
-    ]
-    
-    # Add research context if available
-    research_snippets = load_research_snippets()
-    if research_snippets:
-        research_context = "\n\n".join(research_snippets)
-        messages.append({
-            "role": "system",
-            "content": f"Here is some relevant research context:\n{research_context}"
-        })
-    
-    # Add conversation history
-    for conv in memory["conversations"][-5:]:  # Only include last 5 conversations
-        messages.append({"role": "user", "content": conv["user"]})
-        messages.append({"role": "assistant", "content": conv["assistant"]})
-    
-    # Add current user input
-    messages.append({"role": "user", "content": user_input})
-    
-    # Get response from OpenAI
-    response = client.chat.completions.create(
-        model="gpt-4",  # Using GPT-4 as it's more capable for this use case
-        messages=messages,
-        temperature=0.7,
-        max_tokens=500
+         - Users can send you voice messages using a press-to-talk button. If a user asks if you can hear them, or says something like 'Hello Moira, can you hear me?', respond warmly and let them know you received their voice message and are ready to help.'''
+
+# The persona prefix is measured once here and reused for every request
+prompt_builder = PromptBuilder(
+    MOIRA_SYSTEM_PROMPT,
+    context_window=int(os.getenv("MOIRA_CONTEXT_WINDOW", "8192")),
+    reply_tokens=500,
+    research_tokens=RESEARCH_TOKEN_BUDGET,
+    history_tokens=int(os.getenv("MOIRA_HISTORY_TOKENS", "2000"))
+)
+
+PROMPT_SECTIONS = ('system', 'family', 'research', 'summary', 'history', 'user', 'total')
+
+def build_messages(user_input, history):
+    # Fit family context, research and history into the token budget around the static persona prefix
+    research_index.reload_if_changed()
+    with metrics.span('research_search'):
+        passages = research_index.search(user_input, k=RESEARCH_TOP_K, token_budget=RESEARCH_TOKEN_BUDGET)
+    messages, usage = prompt_builder.build(
+        user_input,
+        passages=passages,
+        family_context=family_registry.context_block(),
+        history=history,
+        summary=conversations.long_term_summary()
     )
-    
-    return response.choices[0].message.content
+    for section in PROMPT_SECTIONS:
+        metrics.PROMPT_TOKENS.observe(usage[section], section=section)
+    metrics.PROMPT_DROPPED.inc(usage['dropped_turns'], kind='history_turn')
+    metrics.PROMPT_DROPPED.inc(usage['dropped_passages'], kind='research_passage')
+    metrics.note(prompt_tokens='/'.join(f"{section}:{usage[section]}" for section in PROMPT_SECTIONS))
+    return messages
+
+def response_cache_key(user_input):
+    # Answers depend on the research library, the family profiles and the long-term summary as well as the question
+    return response_cache.key(user_input, research_index.version, family_registry.context_block(),
+                              conversations.long_term_summary())
+
+def cached_answer(user_input, use_cache):
+    if not (use_cache and response_cache):
+        return None, None
+    key = response_cache_key(user_input)
+    answer = response_cache.get(key)
+    metrics.CACHE_REQUESTS.inc(cache='response', result='hit' if answer else 'miss')
+    return key, answer
+
+def ask_moira(user_input, history, use_cache=False):
+    key, answer = cached_answer(user_input, use_cache)
+    if answer:
+        return answer
+    messages = build_messages(user_input, history)
+    # Get response from OpenAI
+    with metrics.span('llm', upstream='openai'):
+        response = client.chat.completions.create(
+            model="gpt-4",  # Using GPT-4 as it's more capable for this use case
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500
+        )
+    metrics.record_tokens(getattr(response, 'usage', None), 'chat')
+    answer = response.choices[0].message.content
+    if key:
+        response_cache.put(key, answer)
+    return answer
+
+def ask_moira_stream(user_input, history, use_cache=False):
+    # Same request as ask_moira, but yields text deltas as they arrive
+    key, answer = cached_answer(user_input, use_cache)
+    if answer:
+        yield answer
+        return
+    messages = build_messages(user_input, history)
+    parts = []
+    with metrics.span('llm', upstream='openai'):
+        stream = client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                # The final chunk carries token usage and no text
+                metrics.record_tokens(getattr(chunk, 'usage', None), 'chat')
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    if key:
+        response_cache.put(key, "".join(parts))
 
 def clean_text_for_speech(text):
     # Remove or replace problematic punctuation (e.g., asterisks, markdown, etc.)
@@ -172,166 +375,373 @@ def clean_text_for_speech(text):
     # Add more rules as needed
     return text
 
+def synthesize_speech(text):
+    with metrics.span('tts', upstream='elevenlabs'):
+        return generate(
+            text=text,
+            voice=VOICE_ID,
+            model=TTS_MODEL
+        )
+
 def generate_audio(text):
-    # Clean up old audio files
-    cleanup_old_audio()
-    
     # Clean text for speech
     text = clean_text_for_speech(text)
     
-    # Generate new audio file
-    timestamp = int(time.time())
-    audio = generate(
-        text=text,
-        voice=VOICE_ID,
-        model="eleven_flash_v2"
-    )
-    
-    filename = f"static/audio/response_{timestamp}.mp3"
-    with open(filename, 'wb') as f:
-        f.write(audio)
-    
-    return f"/static/audio/response_{timestamp}.mp3"
-
-def cleanup_old_audio():
-    # Keep only the 10 most recent audio files
-    audio_files = glob.glob("static/audio/*.mp3")
-    if len(audio_files) > 10:
-        audio_files.sort(key=os.path.getctime)
-        for file in audio_files[:-10]:
-            try:
-                os.remove(file)
-            except:
-                pass
+    # Repeated text (greetings, canned notices) is served from the cache without an API call
+    filename, hit = audio_cache.get_or_create(text, VOICE_ID, TTS_MODEL, synthesize_speech)
+    metrics.CACHE_REQUESTS.inc(cache='audio', result='hit' if hit else 'miss')
+    return f"/{AUDIO_DIR}/{filename}"
 
 def get_log_for_date(date_str):
-    filename = os.path.join(LOGS_DIR, f"{date_str}.txt")
-    if not os.path.exists(filename):
-        return None
-    with open(filename, 'r', encoding='utf-8') as f:
-        return f.read()
+    return daily_logs.read_day(date_str)
+
+RECALL_PHRASE = 'remember what we talked about'
 
-def extract_log_date_from_question(question):
-    # Look for phrases like 'last Thursday', 'yesterday', 'on June 1st', etc.
-    if 'remember what we talked about' in question.lower():
+def extract_log_range_from_question(question):
+    # Look for phrases like 'last Thursday', 'yesterday', 'on June 1st', 'last week', 'since Monday', etc.
+    if RECALL_PHRASE in question.lower():
         # Extract the date phrase after 'about'
-        import re
         match = re.search(r'about (.+?)(\?|$)', question, re.IGNORECASE)
         if match:
-            date_phrase = match.group(1).strip()
-            dt = dateparser.parse(date_phrase, settings={'PREFER_DATES_FROM': 'past'})
-            if dt:
-                return dt.strftime('%Y-%m-%d')
+            date_phrase = re.sub(r'^on ', '', match.group(1).strip(), flags=re.IGNORECASE)
+            return parse_log_range(date_phrase)
     return None
 
-def detect_document_request(user_input, memory):
+def recall_logs(start, end):
+    # Only cached day summaries are used here; days without one are answered from their entries and summarized
+    # in the background
+    if start == end:
+        date_str = start.strftime('%Y-%m-%d')
+        log_content = daily_logs.cached_summary(date_str)
+        if not log_content:
+            log_content = get_log_for_date(date_str)
+            if log_content:
+                daily_logs.queue_summaries([date_str])
+        if log_content:
+            return f"Here is what we talked about on {date_str} (summary or full log):\n\n{log_content}"
+        return f"I'm sorry, I couldn't find any logs for {date_str}."
+    dates = daily_logs.dates_between(start, end)
+    if not dates:
+        return f"I'm sorry, I couldn't find any logs between {start} and {end}."
+    # Prefer cached day summaries; otherwise stream that day's entries until the reply is long enough
+    parts = [f"Here is what we talked about from {start} to {end}:\n"]
+    length = 0
+    unsummarized = []
+    for date_str in dates:
+        summary = daily_logs.cached_summary(date_str)
+        if summary:
+            block = f"{date_str}:\n{summary}\n"
+        else:
+            unsummarized.append(date_str)
+            lines = [f"- You: {e['user'][:200]}\n  Moira: {e['assistant'][:300]}" for e in daily_logs.iter_entries(date_str, date_str)]
+            block = f"{date_str}:\n" + "\n".join(lines) + "\n"
+        if length + len(block) > MAX_RECALL_CHARS:
+            parts.append(f"...and more from {date_str} onwards. Ask me about a specific day for the full details.")
+            break
+        parts.append(block)
+        length += len(block)
+    daily_logs.queue_summaries(unsummarized)
+    return "\n".join(parts)
+
+# "when did we last discuss melatonin?", "have we talked about sleep?"
+HISTORY_SEARCH_RE = re.compile(
+    r"\b(?:when did (?:we|i) (?:last |first )?(?:discuss|talk about|mention|speak about|chat about)|"
+    r"have we (?:ever )?(?:discussed|talked about|mentioned)|search (?:our|my) (?:history|conversations|notes) for)"
+    r"\s+(.+?)[\s?.!]*$",
+    re.IGNORECASE
+)
+
+def sync_search_index():
+    # Catches up on anything changed while no process was indexing; only day logs that changed are re-read, and
+    # turns still in the conversation store are checked too in case their log is missing
+    started = time.time()
+    try:
+        days = search_index.sync_logs(daily_logs)
+        search_index.sync_turns(conversations.iter_all())
+        search_index.sync_summaries(conversations.summaries())
+        search_index.sync_issues(health_store.iter_issues())
+        search_index.sync_profiles(family_registry.all())
+    except Exception as e:
+        print(f"[Moira] Search index sync failed: {e}")
+        return
+    print(f"[Moira] Search index synced ({days} day logs re-read) in {time.time() - started:.2f}s")
+
+def is_history_request(text):
+    # Turns that only searched or recalled past conversations; their replies quote other turns
+    return bool(HISTORY_SEARCH_RE.search(text)) or RECALL_PHRASE in text.lower()
+
+def recall_topic(user_input):
+    match = HISTORY_SEARCH_RE.search(user_input)
+    if not match:
+        return None
+    topic = re.sub(r'^(?:the|a|an|about)\s+', '', match.group(1).strip(), flags=re.IGNORECASE)
+    # Earlier recall questions mention the topic too, but aren't a discussion of it
+    found = search_index.search(topic, kinds=['conversation'], per_page=1, newest_first=True,
+                                exclude_title=is_history_request)
+    turns = found['results']
+    notes = search_index.search(topic, kinds=['health', 'family'], per_page=1)['total']
+    if not turns:
+        reply = f"I can't find anything in our conversations about {topic}."
+    else:
+        last = turns[0]
+        when = datetime.strptime(last['date'], '%Y-%m-%d %H:%M:%S').strftime('%A %d %B %Y')
+        reply = f"We last talked about {topic} on {when}, when you said: \"{last['title']}\""
+        if found['total'] > 1:
+            reply += f"\nIt has come up in about {found['total']} conversations."
+    if notes:
+        reply += f"\n{notes} health or family note{'s' if notes != 1 else ''} mention{'s' if notes == 1 else ''} it too."
+    return reply
+
+DOCUMENT_RANGE_RE = re.compile(r'\s+(?:(?:during|over|in|for)\s+)?((?:since|from|between|the last|the past|last|past|this)\b.*)$')
+SAVE_DOCUMENTS = os.getenv("MOIRA_SAVE_DOCUMENTS", "0") == "1"  # keep a copy in documents/ as each one is downloaded
+
+def parse_document_subject(text):
+    # "amelia since june 1" -> ('amelia', '2025-06-01', '<today>'); the range is optional
+    since = until = None
+    match = DOCUMENT_RANGE_RE.search(text)
+    if match:
+        date_range = parse_log_range(match.group(1))
+        if date_range:
+            since, until = (d.strftime('%Y-%m-%d') for d in date_range)
+            text = text[:match.start()]
+    match = re.match(r'\s*([a-zA-Z0-9_\- ]+)', text)
+    person = match.group(1).strip() if match and match.group(1).strip() else 'Unknown'
+    return person, since, until
+
+def document_link(kind, **params):
+    params = {k: v for k, v in params.items() if v is not None}
+    if SAVE_DOCUMENTS:
+        params['save'] = '1'
+    query = urlencode(params)
+    return f"/documents/stream/{kind}" + (f"?{query}" if query else '')
+
+def detect_document_request(user_input, history):
     user_input_lower = user_input.lower()
+    # Documents are rendered when the link is opened, so only the filters are worked out here
     # Medical summary
-    if 'medical summary for' in user_input_lower:
-        import re
-        match = re.search(r'medical summary for ([a-zA-Z0-9_\- ]+)', user_input_lower)
-        person = match.group(1).strip() if match else 'Unknown'
-        filename = generate_medical_summary(person)
-        return f"Medical summary generated for {person}. You can download it here: /documents/{os.path.basename(filename)}"
+    match = re.search(r'medical summary for (.+)', user_input_lower)
+    if match:
+        person, since, until = parse_document_subject(match.group(1))
+        link = document_link('medical', person=person, since=since, until=until)
+        return f"Medical summary ready for {person}. You can download it here: {link}"
     # Doctor summary
     if 'doctor summary' in user_input_lower:
-        import re
-        match = re.search(r'doctor summary for ([a-zA-Z0-9_\- ]+)', user_input_lower)
-        person = match.group(1).strip() if match else 'Unknown'
-        # Find last visit date and events (stub: use all memory for now)
-        last_visit_date = 'N/A'
-        events = []
-        for conv in memory['conversations']:
-            events.append({'date': conv['timestamp'], 'description': conv['user'] + ' / ' + conv['assistant']})
-        filename = generate_doctor_summary(person, events, last_visit_date)
-        return f"Doctor summary generated for {person}. You can download it here: /documents/{os.path.basename(filename)}"
+        match = re.search(r'doctor summary for (.+)', user_input_lower)
+        person, since, until = parse_document_subject(match.group(1)) if match else ('Unknown', None, None)
+        link = document_link('doctor', person=person, since=since, until=until)
+        return f"Doctor summary ready for {person}. You can download it here: {link}"
     # Schedule
     if 'schedule' in user_input_lower:
-        import re
         match = re.search(r'schedule for ([a-zA-Z0-9_\- ]+)', user_input_lower)
         period = match.group(1).strip() if match else 'today'
-        # Stub: use last 5 conversations as tasks
-        tasks = []
-        for conv in memory['conversations'][-5:]:
-            tasks.append({'time': conv['timestamp'], 'description': conv['user']})
-        filename = generate_schedule(tasks, period)
-        return f"{period.capitalize()} schedule generated. You can download it here: /documents/{os.path.basename(filename)}"
+        # Stub: the last 5 turns before this request are the tasks
+        turn = history[-1]['id'] if history and 'id' in history[-1] else None
+        link = document_link('schedule', period=period, turn=turn)
+        return f"{period.capitalize()} schedule ready. You can download it here: {link}"
     # Dialogue export
     if 'export this conversation' in user_input_lower or 'export this dialogue' in user_input_lower:
-        if memory['conversations']:
-            last = memory['conversations'][-1]
-            filename = generate_dialogue_export(last['user'], last['assistant'])
-            return f"Dialogue export generated. You can download it here: /documents/{os.path.basename(filename)}"
+        if history and 'id' in history[-1]:
+            link = document_link('dialogue', turn=history[-1]['id'])
+            return f"Dialogue export ready. You can download it here: {link}"
     return None
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    user_input = request.json.get('message', '')
-    if not user_input:
-        return jsonify({"error": "No message provided"}), 400
-    
-    # Load memory
-    memory = load_memory()
-    
+def prepare_reply(user_input, history, stream=False):
+    # Returns the reply as a string, or a token iterator when streaming
     # Onboarding flow
     if session.get('onboarding'):
         onboarding_reply, finished = process_onboarding_answer(user_input)
         response = onboarding_reply
         if finished:
             response += "\nYou can add another family member or ask me about your family anytime!"
-    elif user_input.strip().lower() in ["add family member", "add a family member", "new family member", "add someone to the family"]:
-        response = start_onboarding()
-    else:
-        # Health concern detection and logging
+        return response
+    if user_input.strip().lower() in ["add family member", "add a family member", "new family member", "add someone to the family"]:
+        return start_onboarding()
+    if 'summarize new research' in user_input.lower():
+        resummarize_research()
+        return "I've started reading through any new research in the library. I'll keep helping you while that happens in the background."
+    # Document, history and log recall commands are answered directly and never logged as health concerns
+    with metrics.span('document_detection'):
+        response = detect_document_request(user_input, history)
+    if response:
+        return response
+    with metrics.span('history_search'):
+        response = recall_topic(user_input)
+    if response:
+        return response
+    log_range = extract_log_range_from_question(user_input)
+    if log_range:
+        with metrics.span('log_recall'):
+            return recall_logs(*log_range)
+    # Health concern detection
+    with metrics.span('health_detection'):
         patient, keywords, description = detect_health_concern(user_input)
-        health_logged = False
-        if keywords:
+    health = bool(keywords)
+    if health:
+        # Logged before the model is asked, so the concern is kept even if the reply fails
+        with metrics.span('persistence'):
             add_health_issue(patient, description)
-            health_logged = True
-        # Always answer the user's question, even if a health concern was logged
-        doc_response = detect_document_request(user_input, memory)
-        if doc_response:
-            response = doc_response
+    # Health concerns and follow-ups that lean on the conversation are always answered fresh
+    use_cache = not health and not references_conversation(user_input)
+    if stream:
+        response = ask_moira_stream(user_input, history, use_cache=use_cache)
+    else:
+        # Get response from Moira
+        response = ask_moira(user_input, history, use_cache=use_cache)
+    # If health is being logged, prepend a gentle notification
+    if health:
+        notice = f"Health concern detected for {patient} (keywords: {', '.join(keywords)}). I've logged this in the health buffer.\n\n"
+        if isinstance(response, str):
+            response = notice + response
         else:
-            log_date = extract_log_date_from_question(user_input)
-            if log_date:
-                log_content = get_log_for_date(log_date)
-                if log_content:
-                    response = f"Here is what we talked about on {log_date} (summary or full log):\n\n{log_content}"
-                else:
-                    response = f"I'm sorry, I couldn't find any logs for {log_date}."
-            else:
-                # Get response from Moira
-                response = ask_moira(user_input, memory)
-        # If health was logged, prepend a gentle notification
-        if health_logged:
-            response = f"Health concern detected for {patient} (keywords: {', '.join(keywords)}). I've logged this in the health buffer.\n\n" + response
-    
-    # Generate audio
-    audio_url = generate_audio(response)
+            response = itertools.chain([notice], response)
+    return response
+
+def complete_turn(user_input, response):
+    # Persist everything about a finished turn
+    timestamp = get_timestamp()
+    with metrics.span('persistence'):
+        conversations.append(user_input, response, timestamp)
+        append_to_daily_log({
+            "timestamp": timestamp,
+            "user": user_input,
+            "assistant": response
+        })
+        search_index.index_turn(timestamp, user_input, response)
+    if conversations.count() >= HOT_TURNS + COMPACT_BATCH:
+        threading.Thread(target=compact_conversations, name='compaction', daemon=True).start()
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    user_input = request.json.get('message', '')
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
+    with metrics.request('chat'):
+        return chat_reply(user_input)
+
+def chat_reply(user_input):
+    # Load recent conversation history
+    with metrics.span('memory_load'):
+        history = load_history()
+    response = prepare_reply(user_input, history)
     
     # Save to memory
-    memory["conversations"].append({
-        "timestamp": get_timestamp(),
-        "user": user_input,
-        "assistant": response
-    })
-    save_memory(memory)
-    append_to_daily_log({
-        "timestamp": get_timestamp(),
-        "user": user_input,
-        "assistant": response
-    })
+    complete_turn(user_input, response)
     
+    # Cached speech is returned directly; otherwise audio is synthesized in the background
+    cached = audio_cache.lookup(clean_text_for_speech(response), VOICE_ID, TTS_MODEL)
+    if cached:
+        metrics.CACHE_REQUESTS.inc(cache='audio', result='hit')
+        return jsonify({
+            "response": response,
+            "audio_url": f"/{AUDIO_DIR}/{cached}"
+        })
+    job_id = audio_jobs.submit(response)
     return jsonify({
         "response": response,
-        "audio_url": audio_url
+        "audio_url": None,
+        "audio_job": job_id,
+        "audio_status_url": f"/api/audio/{job_id}"
     })
 
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    user_input = request.json.get('message', '')
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
+    
+    # The trace is re-entered inside the generator so streamed stages land in the same request breakdown
+    trace = metrics.Trace('chat_stream')
+    with trace:
+        with metrics.span('memory_load'):
+            history = load_history()
+        # Routing (including onboarding session changes) happens before the stream starts
+        reply = prepare_reply(user_input, history, stream=True)
+    
+    def events():
+        with trace:
+            yield from stream_events()
+        trace.finish()
+    
+    def stream_events():
+        parts = []
+        # Speak each sentence as soon as it is complete; the browser plays this URL while text streams
+        speech = speech_pipeline.start_job(clean=clean_text_for_speech)
+        audio_url = f"/api/audio/stream/{speech.id}"
+        yield sse_event({"type": "audio_stream", "url": audio_url})
+        try:
+            tokens = [reply] if isinstance(reply, str) else reply
+            for token in tokens:
+                parts.append(token)
+                speech.feed(token)
+                yield sse_event({"type": "token", "text": token})
+        except Exception as e:
+            print(f"[Moira] Chat stream failed: {e}")
+            trace.fail()
+            yield sse_event({"type": "error", "error": "Moira could not finish that reply."})
+            return
+        finally:
+            speech.close()
+        response = "".join(parts)
+        complete_turn(user_input, response)
+        yield sse_event({"type": "done", "response": response, "audio_url": audio_url})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/audio/stream/<job_id>')
+def stream_audio(job_id):
+    audio = speech_pipeline.open_stream(job_id)
+    if audio is None:
+        return jsonify({"error": "Unknown audio stream"}), 404
+    return Response(audio, mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/audio/<job_id>')
+def audio_job_status(job_id):
+    # Long-poll with ?wait=<seconds>; 202 + Location while the audio is still being made
+    wait = max(0.0, min(request.args.get('wait', 0.0, type=float), 30))
+    job = audio_jobs.get(job_id, wait=wait)
+    if not job:
+        return jsonify({"error": "Unknown audio job"}), 404
+    if job['status'] == 'done':
+        return jsonify({"status": "done", "audio_url": job['audio_url']})
+    if job['status'] == 'failed':
+        return jsonify({"status": "failed", "error": "Audio could not be generated"}), 500
+    return jsonify({"status": job['status']}), 202, {'Location': f"/api/audio/{job_id}", 'Retry-After': '1'}
+
+@app.route('/api/audio/queue')
+def audio_queue_stats():
+    return jsonify(audio_jobs.stats())
+
+@app.route('/api/audio/cache')
+def audio_cache_stats():
+    return jsonify(audio_cache.stats())
+
+@app.route('/api/chat/cache')
+def response_cache_stats():
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(response_cache.stats(), enabled=True))
+
+@app.route('/api/search')
+def search_history():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    kinds = [k for k in request.args.get('kind', '').split(',') if k] or None
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(50, max(1, request.args.get('per_page', 10, type=int)))
+    with metrics.request('search'):
+        result = search_index.search(query, kinds=kinds, page=page, per_page=per_page,
+                                     newest_first=request.args.get('sort') == 'date')
+    return jsonify(result)
+
 @app.route('/documents/<filename>')
 def download_document(filename):
     return send_from_directory(DOCUMENTS_DIR, filename, as_attachment=True)
@@ -340,207 +750,184 @@ def download_document(filename):
 def transcribe_audio():
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file provided'}), 400
-    audio_file = request.files['audio']
-    # Try local whisper first, fallback to OpenAI API
+    with metrics.request('transcribe') as trace:
+        data = request.files['audio'].read()
+        if transcription_worker.available:
+            # Local model decodes straight from memory; if it is still loading the request waits in the queue
+            try:
+                with metrics.span('transcription', upstream='whisper'):
+                    text = transcription_worker.transcribe(data, timeout=TRANSCRIBE_TIMEOUT)
+            except Exception as e:
+                print(f"[Moira] Local transcription failed: {e}")
+                trace.fail()
+                return jsonify({'error': 'Could not transcribe audio'}), 500
+        elif WHISPER_API_FALLBACK:
+            # Only used when local Whisper isn't installed or failed to load
+            with metrics.span('transcription', upstream='whisper_api'):
+                transcript = client.audio.transcriptions.create(model='whisper-1', file=('input.webm', data))
+            text = transcript.text.strip()
+        else:
+            trace.fail()
+            return jsonify({'error': 'Transcription is unavailable'}), 503
+        return jsonify({'text': text})
+
+@app.route('/api/transcribe/stream', methods=['POST'])
+def start_live_transcription():
+    if not live_transcriber.available:
+        return jsonify({'error': 'Streaming transcription is unavailable'}), 503
+    return jsonify({'session_id': live_transcriber.open().id})
+
+@app.route('/api/transcribe/stream/<session_id>', methods=['POST'])
+def live_transcription_chunk(session_id):
+    session = live_transcriber.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown transcription session'}), 404
+    try:
+        session.feed(request.get_data(), seq=request.args.get('seq', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    text, segments = session.partial()
+    return jsonify({'partial': text, 'segments': segments})
+
+@app.route('/api/transcribe/stream/<session_id>/finish', methods=['POST'])
+def finish_live_transcription(session_id):
+    session = live_transcriber.close(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown transcription session'}), 404
+    with metrics.request('transcribe_stream') as trace:
+        try:
+            # Only the speech after the last pause is still being transcribed at this point
+            with metrics.span('transcription', upstream='whisper'):
+                text = session.finish(timeout=TRANSCRIBE_TIMEOUT)
+        except Exception as e:
+            print(f"[Moira] Streaming transcription failed: {e}")
+            trace.fail()
+            return jsonify({'error': 'Could not transcribe audio'}), 500
+        return jsonify({'text': text})
+
+@app.route('/api/transcribe/health')
+def transcribe_health():
+    health = transcription_worker.health()
+    health['api_fallback'] = WHISPER_API_FALLBACK
+    health['streaming'] = dict(live_transcriber.stats(), available=live_transcriber.available)
+    ok = health['ready'] or (health['status'] == 'unavailable' and WHISPER_API_FALLBACK)
+    return jsonify(health), 200 if ok else 503
+
+# Old documents, logs and caches are trimmed or gzipped by the leader; see retention.py for the limits
+retention = Retention(default_policies(DOCUMENTS_DIR, LOGS_DIR, ARCHIVE_DIR, TEXT_CACHE_DIR), lock_file=RETENTION_LOCK_FILE)
+
+def run_retention():
+    started = time.time()
     try:
-        import whisper
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=True) as tmp:
-            audio_file.save(tmp.name)
-            model = whisper.load_model('base')
-            result = model.transcribe(tmp.name)
-            text = result['text'].strip()
-    except Exception:
-        # Fallback to OpenAI Whisper API
-        import openai
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=True) as tmp:
-            audio_file.save(tmp.name)
-            with open(tmp.name, 'rb') as f:
-                transcript = openai.Audio.transcribe('whisper-1', f)
-                text = transcript['text'].strip()
-    return jsonify({'text': text})
+        report = retention.run()
+    except Exception as e:
+        print(f"[Moira] Retention failed: {e}")
+        return
+    if report:
+        print(f"[Moira] Retention: {summarize_retention(report)} in {time.time() - started:.2f}s")
+
+def startup_maintenance():
+    # Retention first, so logs it compresses are re-indexed once rather than twice
+    run_retention()
+    sync_search_index()
 
 # Schedule the midnight rollover
 scheduler = BackgroundScheduler()
-scheduler.add_job(write_daily_log, 'cron', hour=0, minute=0)
-scheduler.start()
+if LOG_SUMMARIES:
+    # Logs are written per turn; after midnight only yesterday's summary is pre-computed
+    scheduler.add_job(daily_logs.summarize_day, 'cron', hour=0, minute=5)
+# Catches up on compaction after failures or a large legacy import; turns normally trigger it themselves
+scheduler.add_job(compact_conversations, 'interval', hours=1)
+scheduler.add_job(sync_search_index, 'interval', hours=1)
+scheduler.add_job(run_retention, 'cron', hour=3, minute=30)
 
 # --- Document Templates ---
-def generate_doctor_summary(person, events, last_visit_date, filename=None):
-    summary = f"Doctor Summary for {person}\n"
-    summary += f"Since last visit on {last_visit_date}:\n\n"
-    for event in events:
-        summary += f"- {event['date']}: {event['description']}\n"
-    if not filename:
-        filename = os.path.join(DOCUMENTS_DIR, f"doctor_summary_{person}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(summary)
-    return filename
-
-def generate_schedule(tasks, period, filename=None):
-    schedule = f"{period.capitalize()} Schedule\n\n"
-    for task in tasks:
-        schedule += f"- {task['time']}: {task['description']}\n"
-    if not filename:
-        filename = os.path.join(DOCUMENTS_DIR, f"schedule_{period}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(schedule)
-    return filename
-
-def generate_dialogue_export(user_question, moira_response, filename=None):
-    export = f"User: {user_question}\n\nMoira: {moira_response}\n"
-    if not filename:
-        filename = os.path.join(DOCUMENTS_DIR, f"dialogue_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(export)
-    return filename
-
-def load_health_buffer():
-    with open(HEALTH_BUFFER_FILE, 'r') as f:
-        return json.load(f)
-
-def save_health_buffer(buffer):
-    with open(HEALTH_BUFFER_FILE, 'w') as f:
-        json.dump(buffer, f, indent=2)
-
-def load_health_records():
-    with open(HEALTH_RECORDS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_health_records(records):
-    with open(HEALTH_RECORDS_FILE, 'w') as f:
-        json.dump(records, f, indent=2)
+def day_end(date_str):
+    return f"{date_str} 23:59:59" if date_str else None
 
-def add_health_issue(patient, description, status='ongoing', date=None):
-    buffer = load_health_buffer()
-    entry = {
-        'patient': patient,
-        'description': description,
-        'status': status,
-        'date': date or get_timestamp(),
-        'updates': []
-    }
-    buffer.append(entry)
-    save_health_buffer(buffer)
-    return entry
-
-def update_health_issue(index, update_text, status=None):
-    buffer = load_health_buffer()
-    if 0 <= index < len(buffer):
-        buffer[index]['updates'].append({'date': get_timestamp(), 'update': update_text})
-        if status:
-            buffer[index]['status'] = status
-        save_health_buffer(buffer)
-        return buffer[index]
+def render_document(kind, args):
+    # Returns (file name stem, chunk generator); filters go to the stores so nothing is built up in memory
+    person = args.get('person') or 'Unknown'
+    since, until = args.get('since'), args.get('until')
+    if kind == 'medical':
+        counts = health_store.issue_counts(person, since, day_end(until))
+        issues = health_store.iter_patient_issues(person, since, day_end(until))
+        return f"medical_summary_{person}", documents.medical_summary(person, get_timestamp(), counts, issues)
+    if kind == 'doctor':
+        # Only the archived periods and turns in range that mention this person
+        summaries = conversations.summaries(since, day_end(until))
+        turns = conversations.iter_range(since, day_end(until), contains=None if person == 'Unknown' else person)
+        return f"doctor_summary_{person}", documents.doctor_summary(person, since, summaries, turns)
+    if kind == 'schedule':
+        period = args.get('period') or 'today'
+        turn = args.get('turn', type=int)
+        turns = conversations.recent_until(turn, 5) if turn else conversations.recent(5)
+        return f"schedule_{period}", documents.schedule(period, turns)
+    if kind == 'dialogue':
+        turn = conversations.get(args.get('turn', type=int)) or conversations.last()
+        if turn is None:
+            return None
+        return "dialogue", documents.dialogue_export(turn)
     return None
 
-def resolve_health_issue(index):
-    buffer = load_health_buffer()
-    records = load_health_records()
-    if 0 <= index < len(buffer):
-        buffer[index]['status'] = 'resolved'
-        buffer[index]['resolved_date'] = get_timestamp()
-        records.append(buffer[index])
-        del buffer[index]
-        save_health_buffer(buffer)
-        save_health_records(records)
-        return True
-    return False
+@app.route('/documents/stream/<kind>')
+def stream_document(kind):
+    rendered = render_document(kind, request.args)
+    if rendered is None:
+        return jsonify({'error': 'Unknown document'}), 404
+    stem, chunks = rendered
+    filename = re.sub(r'[^\w\-]', '_', stem) + f"_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    if request.args.get('save') == '1':
+        chunks = documents.tee_to_file(chunks, os.path.join(DOCUMENTS_DIR, filename))
+    return Response(stream_with_context(documents.buffered(chunks)), mimetype='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def add_health_issue(patient, description, status='ongoing', date=None):
+    issue = health_store.add_issue(patient, description, status, date or get_timestamp())
+    search_index.index_issue(issue)
+    return issue
+
+def update_health_issue(issue_id, update_text, status=None):
+    issue = health_store.update_issue(issue_id, update_text, get_timestamp(), status=status)
+    if issue:
+        search_index.index_issue(issue)
+    return issue
+
+def resolve_health_issue(issue_id):
+    resolved = health_store.resolve_issue(issue_id, get_timestamp())
+    if resolved:
+        search_index.index_issue(health_store.get_issue(issue_id))
+    return resolved
 
 # --- Health Concern Detection ---
-HEALTH_KEYWORDS = [
-    'fever', 'rash', 'not eating', 'seizure', 'doctor', 'er', 'hurt', 'pain', 'vomit', 'vomiting',
-    'appointment', 'medication', 'hospital', 'sick', 'injury', 'allergy', 'meltdown', 'anxious',
-    'panic', 'headache', 'stomach', 'sleep', 'behavior', 'diarrhea', 'constipation', 'infection',
-    'wound', 'cut', 'bruise', 'bleeding', 'cough', 'cold', 'flu', 'asthma', 'breathing', 'therapy',
-    'prescription', 'swelling', 'redness', 'temperature', 'clinic', 'urgent', 'ambulance', 'doctor\'s visit',
-    'checkup', 'check-up', 'diagnosis', 'treatment', 'prescribed', 'dose', 'dizzy', 'dizziness', 'nausea', 'cramp',
-    'cramps', 'sore', 'throat', 'earache', 'infection', 'eczema', 'eczema flare', 'eczema outbreak', 'eczema episode'
-]
-PATIENT_NAMES = ['Amelia', 'Callan', 'Torin', 'Kyla-lyn', 'Roman']  # Expand as needed
-
-FUZZY_THRESHOLD = 80  # percent similarity for a match
-
-# --- Fuzzy Health Concern Detection ---
-def fuzzy_find_matches(input_text, choices, threshold=FUZZY_THRESHOLD, require_word_match=False):
-    matches = []
-    for choice in choices:
-        if require_word_match:
-            # Only match if the word appears as a whole word
-            import re
-            if re.search(r'\\b' + re.escape(choice.lower()) + r'\\b', input_text.lower()):
-                matches.append(choice)
-        else:
-            score = fuzz.partial_ratio(choice.lower(), input_text.lower())
-            if score >= threshold:
-                matches.append(choice)
-    return matches
+# Keywords and names come from config/health_vocabulary.json plus the family profiles
+health_matcher = HealthMatcher(threshold=FUZZY_THRESHOLD)
+
+def refresh_health_vocabulary():
+    return refresh_matcher(health_matcher, HEALTH_VOCABULARY_FILE, family_registry.all(refresh=False))
+
+def family_changed():
+    refresh_health_vocabulary()
+    search_index.sync_profiles(family_registry.all(refresh=False))
 
 def detect_health_concern(user_input):
-    # Use strict word match for health keywords, fuzzy for names
-    found_keywords = fuzzy_find_matches(user_input, HEALTH_KEYWORDS, threshold=90, require_word_match=True)
-    found_names = fuzzy_find_matches(user_input, PATIENT_NAMES)
-    if found_keywords:
-        patient = found_names[0] if found_names else 'Unknown'
-        return patient, found_keywords, user_input
-    return None, None, None
-
-def generate_medical_summary(patient, filename=None):
-    buffer = load_health_buffer()
-    records = load_health_records()
-    all_issues = [e for e in buffer + records if e['patient'].lower() == patient.lower()]
-    summary = f"Medical Summary for {patient}\n"
-    summary += f"Generated on: {get_timestamp()}\n"
-    summary += "="*40 + "\n\n"
-    if not all_issues:
-        summary += "No health issues recorded for this patient.\n"
-    else:
-        # Brief summary section
-        ongoing = [e for e in all_issues if e['status'] == 'ongoing']
-        resolved = [e for e in all_issues if e['status'] == 'resolved']
-        summary += f"Ongoing issues: {len(ongoing)}\n"
-        summary += f"Resolved issues: {len(resolved)}\n\n"
-        # Detailed log
-        for issue in sorted(all_issues, key=lambda x: x['date']):
-            summary += f"Date: {issue['date']}\n"
-            summary += f"Status: {issue['status'].capitalize()}\n"
-            summary += f"Description: {issue['description']}\n"
-            if issue.get('updates'):
-                for upd in issue['updates']:
-                    summary += f"  Update ({upd['date']}): {upd['update']}\n"
-            if issue.get('resolved_date'):
-                summary += f"Resolved on: {issue['resolved_date']}\n"
-            summary += "-"*30 + "\n"
-    if not filename:
-        filename = os.path.join(DOCUMENTS_DIR, f"medical_summary_{patient}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(summary)
-    return filename
+    # Pick up profiles added or edited on disk before matching names
+    family_registry.refresh()
+    # Whole-word match for health keywords, fuzzy match for names
+    return health_matcher.detect(user_input)
 
 def get_family_member_path(name):
-    safe_name = name.replace(' ', '_').lower()
-    return os.path.join(FAMILY_DIR, f'{safe_name}.json')
+    return os.path.join(FAMILY_DIR, profile_filename(name))
 
 def load_family_member(name):
-    path = get_family_member_path(name)
-    if os.path.exists(path):
-        with open(path, 'r') as f:
-            return json.load(f)
-    return None
+    return family_registry.get(name)
 
 def save_family_member(data):
-    path = get_family_member_path(data['name'])
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2)
+    # The registry updates its cache and the health matcher's names straight away
+    family_registry.save(data)
 
 def list_family_members():
-    members = []
-    for filename in os.listdir(FAMILY_DIR):
-        if filename.endswith('.json'):
-            with open(os.path.join(FAMILY_DIR, filename), 'r') as f:
-                members.append(json.load(f))
-    return members
+    return family_registry.all()
 
 ONBOARDING_QUESTIONS = [
     ("name", "What is the family member's full name?"),
@@ -583,65 +970,169 @@ def process_onboarding_answer(answer):
         session.pop('onboarding', None)
         return f"Family member '{data['name']}' added!", True
 
-def extract_text(filepath):
-    if filepath.endswith(".txt"):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif filepath.endswith(".pdf"):
+# PDF text is extracted once per content hash, in killable worker processes, and kept compressed on disk
+extractor = Extractor(
+    TEXT_CACHE_DIR,
+    workers=int(os.getenv("MOIRA_EXTRACT_WORKERS", "2")),
+    timeout=int(os.getenv("MOIRA_EXTRACT_TIMEOUT", "120"))
+)
+
+# Whole documents are summarized chunk by chunk; chunk summaries are cached so re-runs only pay for new text
+research_summarizer = MapReduceSummarizer(
+    client, CHUNK_SUMMARY_DB,
+    chunk_tokens=int(os.getenv("MOIRA_SUMMARY_CHUNK_TOKENS", "3000")),
+    workers=int(os.getenv("MOIRA_SUMMARY_CONCURRENCY", "4")),
+    price_in=float(os.getenv("MOIRA_SUMMARY_PRICE_IN", "0.0005")),
+    price_out=float(os.getenv("MOIRA_SUMMARY_PRICE_OUT", "0.0015"))
+)
+
+def summarize_with_gpt(text, name=None, progress=None):
+    return research_summarizer.summarize(text, name=name, progress=progress)
+
+# --- Research Index ---
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+def index_summary(file, summary):
+    fingerprint = hashlib.sha1(summary.encode('utf-8')).hexdigest()
+    return research_index.add_document(f"summary:{file}", summary, kind='summary', fingerprint=fingerprint)
+
+def sync_research_index(summaries):
+    # Only (re)index summaries and documents whose content changed since the last run
+    for file, summary in summaries.items():
+        index_summary(file, summary)
+    seen = set()
+    for directory in (RESEARCH_DIR, PROCESSED_DIR):
+        for file in os.listdir(directory):
+            if not (file.endswith(".pdf") or file.endswith(".txt")):
+                continue
+            filepath = os.path.join(directory, file)
+            source = f"fulltext:{file}"
+            seen.add(source)
+            fingerprint = file_fingerprint(filepath)
+            if research_index.fingerprint(source) == fingerprint:
+                continue
+            try:
+                content = extractor.extract(filepath)
+            except ExtractionError as e:
+                print(f"[Moira] Skipping {file} in the research index: {e}")
+                continue
+            if content.strip():
+                research_index.add_document(source, content, kind='fulltext', fingerprint=fingerprint)
+    for source in list(research_index.sources):
+        if source.startswith("fulltext:") and source not in seen:
+            research_index.remove_document(source)
+    # Also saves documents indexed during the scan that haven't been written yet
+    if research_index.save_if_dirty():
+        print(f"[Moira] Research index updated: {research_index.stats()}")
+    # Runs after every scan, including the one at startup, so canned answers track the current library
+    start_response_cache_warm()
+
+def warm_response_cache():
+    # Answer (and speak) the home page's pre-question buttons ahead of time so pressing one is instant
+    if not response_cache_warming.acquire(blocking=False):
+        return
+    try:
+        with file_lock(RESPONSE_CACHE_WARM_LOCK_FILE, blocking=False) as locked:
+            # Skipped when another process is already filling the shared cache
+            if locked:
+                precompute_canned_answers()
+    finally:
+        response_cache_warming.release()
+
+def precompute_canned_answers():
+    warmed = 0
+    for question in canned_questions(os.path.join(app.root_path, 'templates', 'index.html')):
+        if response_cache.contains(response_cache_key(question)):
+            continue
         try:
-            from PyPDF2 import PdfReader
-            reader = PdfReader(filepath)
-            return "\n".join([page.extract_text() or "" for page in reader.pages])
+            answer = ask_moira(question, [], use_cache=True)
+            generate_audio(answer)
+            warmed += 1
         except Exception as e:
-            print(f"[Moira] Failed to extract PDF: {filepath}: {e}")
-            return ""
-    else:
-        return ""
-
-def summarize_with_gpt(text):
-    trimmed = text[:6000]
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "Summarize this document to help support an autistic child. Be clear and gentle."},
-            {"role": "user", "content": trimmed}
-        ],
-        max_tokens=500
-    )
-    return response.choices[0].message["content"].strip()
+            print(f"[Moira] Could not precompute an answer for '{question}': {e}")
+    if warmed:
+        print(f"[Moira] Precomputed {warmed} canned answers")
 
-def summarize_research_files():
-    summaries = {}
-    if os.path.exists(SUMMARY_FILE):
-        with open(SUMMARY_FILE, 'r') as f:
-            try:
-                summaries = json.load(f)
-            except Exception:
-                summaries = {}
-    files = [f for f in os.listdir(RESEARCH_DIR) if f.endswith(".pdf") or f.endswith(".txt")]
-    for file in files:
-        filepath = os.path.join(RESEARCH_DIR, file)
-        if file in summaries:
-            continue  # Already summarized
-        content = extract_text(filepath)
-        if content.strip():
-            try:
-                summary = summarize_with_gpt(content)
-                summaries[file] = summary
-                # Move processed file to processed dir
-                shutil.move(filepath, os.path.join(PROCESSED_DIR, file))
-            except Exception as e:
-                print(f"[Moira] Failed to summarize {file}: {e}")
-    with open(SUMMARY_FILE, 'w') as f:
-        json.dump(summaries, f, indent=2)
-    return summaries
+def start_response_cache_warm():
+    if response_cache is not None:
+        threading.Thread(target=warm_response_cache, name='response-cache-warm', daemon=True).start()
+
+def index_ingested_document(file, filepath, content, summary):
+    index_summary(file, summary)
+    research_index.add_document(f"fulltext:{file}", content, kind='fulltext', fingerprint=file_fingerprint(filepath))
+    # The whole index is written once the scan completes; during a long scan progress is saved every so often
+    research_index.save_if_dirty(interval=RESEARCH_INDEX_SAVE_SECONDS)
+
+ingestion = IngestionQueue(
+    RESEARCH_DIR, PROCESSED_DIR, SUMMARY_FILE, INGEST_MANIFEST_FILE,
+    summarize=summarize_with_gpt,
+    on_document=index_ingested_document,
+    on_start=lambda: research_index.reload_if_changed(force=True),
+    on_complete=sync_research_index,
+    extract=extractor.extract,
+    extract_workers=int(os.getenv("MOIRA_EXTRACT_WORKERS", "2")),
+    summarize_workers=int(os.getenv("MOIRA_SUMMARIZE_WORKERS", "2"))
+)
 
-# Call this at startup
-summarize_research_files()
+# Build the health matcher once from config and family profiles
+refresh_health_vocabulary()
+
+leader = LeaderLock(LEADER_LOCK_FILE)
+
+def start_leader_services():
+    # Exactly one process runs the scheduler, cache eviction and the startup research scan
+    audio_cache.start_evictor()
+    scheduler.start()
+    threading.Thread(target=startup_maintenance, name='maintenance', daemon=True).start()
+    # Scan for new research at startup without holding up the server
+    ingestion.enqueue()
+
+def start_services():
+    # Called once per serving process (wsgi.create_app or the dev server), never at import
+    transcription_worker.start()
+    ingestion.start()
+    if leader.start(start_leader_services):
+        print(f"[Moira] Process {os.getpid()} is running background jobs")
 
 # Add a function to re-summarize on demand (e.g., via a Moira command)
 def resummarize_research():
-    return summarize_research_files()
+    return ingestion.enqueue()
+
+def collect_metrics():
+    # Point-in-time values read from the queues and caches when /metrics is scraped
+    cache = audio_cache.stats()
+    jobs = audio_jobs.stats()
+    research = ingestion.status()
+    samples = [
+        ('moira_audio_cache_files', 'gauge', 'Files in the speech cache.', {}, cache['files']),
+        ('moira_audio_cache_bytes', 'gauge', 'Bytes in the speech cache.', {}, cache['bytes']),
+        ('moira_audio_cache_evictions_total', 'counter', 'Speech cache evictions.', {}, cache['evictions']),
+        ('moira_audio_jobs', 'gauge', 'Background audio jobs by status.', {'status': 'queued'}, jobs['queue_depth']),
+        ('moira_audio_jobs', 'gauge', 'Background audio jobs by status.', {'status': 'running'}, jobs['running']),
+        ('moira_ingestion_documents_total', 'counter', 'Research documents ingested.', {'result': 'completed'}, research['completed']),
+        ('moira_ingestion_documents_total', 'counter', 'Research documents ingested.', {'result': 'failed'}, len(research['failed'])),
+        ('moira_ingestion_documents_total', 'counter', 'Research documents ingested.', {'result': 'skipped'}, research['skipped']),
+    ]
+    for kind, count in search_index.stats().items():
+        samples.append(('moira_search_index_entries', 'gauge', 'Entries in the search index.', {'kind': kind}, count))
+    if response_cache:
+        samples.append(('moira_response_cache_entries', 'gauge', 'Answers held in the response cache.', {},
+                        response_cache.stats()['entries']))
+    return samples
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/research/status')
+def research_status():
+    status = ingestion.status()
+    status['index'] = research_index.stats()
+    return jsonify(status)
 
 if __name__ == '__main__':
     # Get IP address
@@ -653,4 +1144,7 @@ if __name__ == '__main__':
     print(f"Local access: http://localhost:5000")
     print(f"Network access: http://{local_ip}:5000")
     
-    app.run(host='0.0.0.0', port=5000, debug=True) 
+    # With the debug reloader only the child process that serves requests starts the background services
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
+    app.run(host='0.0.0.0', port=5000, debug=True)
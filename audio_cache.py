@@ -0,0 +1,151 @@
+"""Content-addressed cache for synthesized speech with LRU eviction off the request path."""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def cache_key(text, voice, model):
+    return hashlib.sha256(f"{voice}\0{model}\0{text}".encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, max_files=500):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # filename -> size, least recently used first
+        self.total_bytes = 0
+        self.in_flight = {}           # key -> lock held while that text is being synthesized
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.wake = threading.Event()
+        self.evictor = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Rebuild LRU order from modification times (hits touch the file)
+        self.entries.clear()
+        self.total_bytes = 0
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.mp3') and not name.startswith('.'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def filename(self, key):
+        return f"tts_{key[:40]}.mp3"
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def lookup(self, text, voice, model):
+        filename = self.filename(cache_key(text, voice, model))
+        try:
+            size = os.path.getsize(self.path(filename))
+        except OSError:
+            return None
+        with self.lock:
+            if filename not in self.entries:
+                # Stored by another worker process
+                self.entries[filename] = size
+                self.total_bytes += size
+            self.entries.move_to_end(filename)
+            self.hits += 1
+        try:
+            os.utime(self.path(filename))
+        except OSError:
+            pass
+        return filename
+
+    def store(self, text, voice, model, audio):
+        filename = self.filename(cache_key(text, voice, model))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.mp3')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp, self.path(filename))
+        with self.lock:
+            self.total_bytes += len(audio) - self.entries.pop(filename, 0)
+            self.entries[filename] = len(audio)
+            over = self.total_bytes > self.max_bytes or len(self.entries) > self.max_files
+        if over:
+            self.wake.set()
+        return filename
+
+    def get_or_create(self, text, voice, model, synthesize):
+        # Returns (filename, hit); concurrent requests for the same text share one synthesis
+        filename = self.lookup(text, voice, model)
+        if filename:
+            return filename, True
+        key = cache_key(text, voice, model)
+        with self.lock:
+            key_lock = self.in_flight.setdefault(key, threading.Lock())
+        with key_lock:
+            filename = self.lookup(text, voice, model)
+            if filename:
+                return filename, True
+            with self.lock:
+                self.misses += 1
+            try:
+                return self.store(text, voice, model, synthesize(text)), False
+            finally:
+                with self.lock:
+                    self.in_flight.pop(key, None)
+
+    def read(self, filename):
+        with open(self.path(filename), 'rb') as f:
+            return f.read()
+
+    def evict(self):
+        removed = []
+        with self.lock:
+            # Other worker processes write to the same directory, so resync with the disk first
+            self._load()
+            while self.entries and (self.total_bytes > self.max_bytes or len(self.entries) > self.max_files):
+                filename, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                removed.append(filename)
+            self.evictions += len(removed)
+        for filename in removed:
+            try:
+                os.remove(self.path(filename))
+            except OSError:
+                pass
+        return removed
+
+    def start_evictor(self, interval=300):
+        # Evict when a store pushes the cache over budget, and periodically as a safety net
+        def run():
+            while True:
+                self.wake.wait(timeout=interval)
+                self.wake.clear()
+                self.evict()
+
+        if self.evictor is None:
+            self.evictor = threading.Thread(target=run, name='audio-cache-evictor', daemon=True)
+            self.evictor.start()
+            self.wake.set()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'files': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_files': self.max_files,
+                'max_bytes': self.max_bytes,
+            }
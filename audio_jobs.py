@@ -0,0 +1,160 @@
+"""Background audio synthesis jobs so text replies can return before their speech is ready."""
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import SQLiteStore
+
+JOB_TTL_SECONDS = 600
+LATENCY_SAMPLES = 200
+POLL_SECONDS = 0.2
+
+
+class AudioJobStore(SQLiteStore):
+    # Job status shared by all worker processes, so a status poll or audio stream can land on any of them.
+    # 'reply' jobs synthesize a whole reply; 'stream' jobs list the sentences of a streamed reply in speech_parts
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            audio_url TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+        CREATE INDEX IF NOT EXISTS jobs_kind_status ON jobs (kind, status);
+        CREATE TABLE IF NOT EXISTS speech_parts (
+            job_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            filename TEXT,
+            PRIMARY KEY (job_id, seq)
+        );
+    '''
+
+    # Job status only matters for a few minutes
+    SYNCHRONOUS = 'NORMAL'
+
+    def create(self, job_id, kind, status='queued'):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO jobs (id, kind, status, created, started) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, kind, status, now, now if status == 'running' else None))
+
+    def update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self.transaction() as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', list(fields.values()) + [job_id])
+
+    def get(self, job_id):
+        row = self.connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self, kind):
+        rows = self.connection().execute(
+            'SELECT status, COUNT(*) AS n FROM jobs WHERE kind = ? GROUP BY status', (kind,))
+        return {row['status']: row['n'] for row in rows}
+
+    def add_part(self, job_id, seq):
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO speech_parts (job_id, seq, status) VALUES (?, ?, 'queued')", (job_id, seq))
+
+    def finish_part(self, job_id, seq, filename=None):
+        with self.transaction() as conn:
+            conn.execute('UPDATE speech_parts SET status = ?, filename = ? WHERE job_id = ? AND seq = ?',
+                         ('done' if filename else 'failed', filename, job_id, seq))
+
+    def parts(self, job_id, start=0):
+        rows = self.connection().execute(
+            'SELECT seq, status, filename FROM speech_parts WHERE job_id = ? AND seq >= ? ORDER BY seq',
+            (job_id, start))
+        return [dict(row) for row in rows]
+
+    def prune(self, ttl=JOB_TTL_SECONDS):
+        cutoff = time.time() - ttl
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM speech_parts WHERE job_id IN (SELECT id FROM jobs WHERE created < ?)', (cutoff,))
+            conn.execute('DELETE FROM jobs WHERE created < ?', (cutoff,))
+
+
+class AudioJobQueue:
+    def __init__(self, synthesize, store, workers=2):
+        # synthesize(text) -> audio URL
+        self.synthesize = synthesize
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audio-job')
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.completed = 0
+        self.failed = 0
+        self.wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self.run_times = deque(maxlen=LATENCY_SAMPLES)
+
+    def submit(self, text):
+        job_id = uuid.uuid4().hex
+        self.store.prune()
+        self.store.create(job_id, 'reply')
+        self.executor.submit(self._run, job_id, text)
+        return job_id
+
+    def _run(self, job_id, text):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        started = time.time()
+        self.store.update(job_id, status='running', started=started)
+        try:
+            url = self.synthesize(text)
+            error = None
+        except Exception as e:
+            print(f"[Moira] Audio job {job_id} failed: {e}")
+            url, error = None, str(e)
+        finished = time.time()
+        self.store.update(job_id, status='failed' if error else 'done', audio_url=url, error=error, finished=finished)
+        with self.cond:
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.wait_times.append(started - job['created'])
+            self.run_times.append(finished - started)
+            self.cond.notify_all()
+
+    def get(self, job_id, wait=0):
+        # Long-poll: block up to `wait` seconds for the job to finish. The job may be running in another worker
+        # process, so the store is re-read every POLL_SECONDS; jobs finishing in this process wake the wait early
+        deadline = time.time() + wait
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.time()
+            if not job or job['status'] not in ('queued', 'running') or remaining <= 0:
+                return job
+            with self.cond:
+                self.cond.wait(timeout=min(POLL_SECONDS, remaining))
+
+    def stats(self):
+        # Queue depth covers every worker process; completions and timings are for this process
+        def summary(samples):
+            if not samples:
+                return {'avg_ms': 0, 'p95_ms': 0}
+            ordered = sorted(samples)
+            return {
+                'avg_ms': round(sum(ordered) / len(ordered) * 1000, 1),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+            }
+
+        counts = self.store.counts('reply')
+        with self.lock:
+            return {
+                'queue_depth': counts.get('queued', 0),
+                'running': counts.get('running', 0),
+                'completed': self.completed,
+                'failed': self.failed,
+                'queue_wait': summary(self.wait_times),
+                'synthesis': summary(self.run_times),
+            }
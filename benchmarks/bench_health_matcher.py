@@ -0,0 +1,73 @@
+"""Microbenchmark: per-message cost of health concern detection.
+
+Compares the original per-call loop (one re.search per keyword, one
+fuzz.partial_ratio per name) with the precompiled HealthMatcher.
+
+    python benchmarks/bench_health_matcher.py [--messages 2000]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rapidfuzz import fuzz  # noqa: E402
+
+from health_matcher import HealthMatcher, load_vocabulary  # noqa: E402
+
+VOCABULARY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'health_vocabulary.json')
+
+MESSAGES = [
+    "Amelia has had a fever since last night and isn't eating much.",
+    "How do I handle meltdowns or emotional outbursts?",
+    "Callan had a seizure at school, should we go to the ER?",
+    "What are some fun activities for sensory play this weekend?",
+    "Torin's eczema flare is back and the rash looks red and swollen.",
+    "Can you make a schedule for today? We have therapy at 3pm.",
+    "I'm exhausted. Nobody slept and the kids are fighting.",
+    "Kyla-lyn keeps complaining about a sore throat and earache.",
+]
+
+
+def legacy_detect(text, keywords, names, threshold=80):
+    # The implementation this replaces, kept verbatim for comparison
+    found_keywords = [k for k in keywords if re.search(r'\\b' + re.escape(k.lower()) + r'\\b', text.lower())]
+    found_names = [n for n in names if fuzz.partial_ratio(n.lower(), text.lower()) >= threshold]
+    if found_keywords:
+        return (found_names[0] if found_names else 'Unknown'), found_keywords, text
+    return None, None, None
+
+
+def bench(label, fn, messages):
+    start = time.perf_counter()
+    for message in messages:
+        fn(message)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(messages) * 1e6:9.1f} us/message  ({len(messages)} messages)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--extra-names', type=int, default=0, help='pad the name list to simulate a large family')
+    args = parser.parse_args()
+
+    keywords, names = load_vocabulary(VOCABULARY_FILE)
+    names = names + [f"Person{i}" for i in range(args.extra_names)]
+    messages = [MESSAGES[i % len(MESSAGES)] for i in range(args.messages)]
+
+    matcher = HealthMatcher(keywords, names)
+    build_start = time.perf_counter()
+    HealthMatcher(keywords, names)
+    print(f"{'matcher build (one-off)':<28} {(time.perf_counter() - build_start) * 1e6:9.1f} us")
+
+    legacy = bench('legacy loop', lambda m: legacy_detect(m, keywords, names), messages)
+    compiled = bench('compiled matcher', matcher.detect, messages)
+    print(f"speedup: {legacy / compiled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""WSGI app for load_test.py --gunicorn-workers: the real app with fake upstream services in each worker."""
+import os
+
+from load_test import install_fakes
+import app as moira
+
+install_fakes(
+    moira,
+    llm_latency=float(os.environ['MOIRA_BENCH_LLM_LATENCY']),
+    tokens_per_second=float(os.environ['MOIRA_BENCH_TOKENS_PER_SECOND']),
+    tts_latency=float(os.environ['MOIRA_FAKE_TTS_LATENCY']),
+    whisper_latency=float(os.environ['MOIRA_BENCH_WHISPER_LATENCY']),
+)
+moira.start_services()
+app = moira.app
@@ -0,0 +1,477 @@
+"""Offline load test for /api/chat, /api/chat/stream and /api/transcribe, including the audio they produce.
+
+OpenAI, ElevenLabs and Whisper are replaced with local stand-ins that sleep for
+a configurable latency, so runs cost nothing and are repeatable. The app runs
+in a throwaway data directory on a local threaded server and is driven at the
+requested concurrency. Per-stage p50/p95/p99 are written to
+benchmarks/results/ as JSON so runs can be compared:
+
+    python benchmarks/load_test.py --requests 200 --concurrency 8 --label baseline
+    python benchmarks/load_test.py --requests 200 --concurrency 8 --compare benchmarks/results/baseline-*.json
+
+With --gunicorn-workers the same load is sent to gunicorn (gunicorn.conf.py) started with each
+worker count in turn, to check that throughput scales with workers:
+
+    python benchmarks/load_test.py --requests 400 --concurrency 32 --threads 2 --gunicorn-workers 1,2,4
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+MESSAGES = [
+    "What are some calming techniques for anxiety?",
+    "How do I handle meltdowns or emotional outbursts?",
+    "Amelia has a fever and a rash since this morning.",
+    "What communication strategies work best for non-verbal children?",
+    "Can you make a schedule for today?",
+    "How can I help siblings understand and support each other?",
+    "Callan was sick and had a headache after school.",
+    "How do I advocate for my child at school?",
+]
+
+FAKE_REPLY = ("That sounds like a lot to carry, and you're doing well. Try a quiet corner with soft light. "
+              "Offer a weighted blanket if it helps. Keep your voice low and slow. "
+              "If anything feels serious, call 811 to speak with a nurse.")
+
+
+class FakeOpenAI:
+    # Mimics client.chat.completions.create (blocking and stream=True) and client.audio.transcriptions
+    def __init__(self, latency, tokens_per_second):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.replies = itertools.count(1)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+        self.audio = types.SimpleNamespace(transcriptions=types.SimpleNamespace(
+            create=lambda **kw: types.SimpleNamespace(text='hello moira')))
+
+    def create(self, model=None, messages=None, stream=False, max_tokens=500, **kwargs):
+        # Numbered replies so every answer is new text for the audio cache
+        words = f"{FAKE_REPLY} Reply {next(self.replies)}.".split(' ')
+        prompt_tokens = sum(len(m['content']) // 4 for m in messages or [])
+        usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(words),
+                                      total_tokens=prompt_tokens + len(words))
+        time.sleep(self.latency)
+        if stream:
+            def chunks():
+                for word in words:
+                    time.sleep(1.0 / self.tokens_per_second)
+                    delta = types.SimpleNamespace(content=word + ' ')
+                    yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+            return chunks()
+        time.sleep(len(words) / self.tokens_per_second)
+        message = types.SimpleNamespace(content=' '.join(words))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+class FakeTranscriber:
+    def __init__(self, latency):
+        self.latency = latency
+        self.available = True
+
+    def start(self):
+        pass
+
+    def transcribe(self, data, timeout=None):
+        time.sleep(self.latency)
+        return 'hello moira can you hear me'
+
+    def health(self):
+        return {'status': 'ready', 'ready': True, 'model': 'fake', 'mode': 'thread',
+                'concurrency': 1, 'queue_depth': 0, 'error': None}
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, module, name, stage):
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        setattr(module, name, timed)
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+def prepare_workdir():
+    # The app resolves its data paths relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='moira-bench-')
+    shutil.copytree(os.path.join(REPO_DIR, 'config'), os.path.join(workdir, 'config'))
+    os.makedirs(os.path.join(workdir, 'research', 'processed'))
+    shutil.copy(os.path.join(REPO_DIR, 'research', 'summarized_knowledge.json'), os.path.join(workdir, 'research'))
+    return workdir
+
+
+def fake_environment(args):
+    # Read by the app at import (and by benchmarks/fake_wsgi.py in gunicorn workers)
+    return {
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'benchmark'),
+        'MOIRA_TTS_BACKEND': 'fake',
+        'MOIRA_FAKE_TTS_LATENCY': str(args.tts_latency),
+        'MOIRA_WHISPER_API_FALLBACK': '0',
+        'MOIRA_BENCH_LLM_LATENCY': str(args.llm_latency),
+        'MOIRA_BENCH_TOKENS_PER_SECOND': str(args.tokens_per_second),
+        'MOIRA_BENCH_WHISPER_LATENCY': str(args.whisper_latency),
+    }
+
+
+def install_fakes(moira, llm_latency, tokens_per_second, tts_latency, whisper_latency):
+    moira.client = FakeOpenAI(llm_latency, tokens_per_second)
+    moira.research_summarizer.client = moira.client
+
+    def fake_generate(text, voice=None, model=None, **kwargs):
+        time.sleep(tts_latency)
+        return b'\xff\xfb\x90\x64' + bytes(413)
+
+    moira.generate = fake_generate
+    moira.transcription_worker = FakeTranscriber(whisper_latency)
+    # Generated audio is written under the throwaway data directory, so serve /static from there
+    moira.app.static_folder = os.path.abspath('static')
+
+
+def load_app(args):
+    os.environ.update(fake_environment(args))
+    sys.path.insert(0, REPO_DIR)
+    import app as moira
+    install_fakes(moira, args.llm_latency, args.tokens_per_second, args.tts_latency, args.whisper_latency)
+    return moira
+
+
+def instrument(moira, timer):
+    timer.wrap(moira, 'load_history', 'memory_load')
+    timer.wrap(moira, 'detect_health_concern', 'health_detection')
+    timer.wrap(moira, 'detect_document_request', 'document_detection')
+    timer.wrap(moira, 'ask_moira', 'llm')
+    timer.wrap(moira, 'synthesize_speech', 'tts')
+    timer.wrap(moira, 'complete_turn', 'persistence')
+    timer.wrap(moira.transcription_worker, 'transcribe', 'transcription')
+
+
+def start_server(moira):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, moira.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch(port, method, path, body=None, headers=None):
+    # Each call opens its own connection, so under gunicorn follow-up requests can land on any worker
+    conn = HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def chat_message(rng):
+    # Unique suffix so the response and audio caches don't hide the work being measured
+    return json.dumps({'message': f"{rng.choice(MESSAGES)} ({uuid.uuid4().hex[:6]})"})
+
+
+def chat_request(port, rng, timer):
+    status, body = fetch(port, 'POST', '/api/chat', chat_message(rng), {'Content-Type': 'application/json'})
+    if status != 200:
+        return status, None
+    data = json.loads(body)
+    return status, lambda: deferred_audio(port, data, timer)
+
+
+def deferred_audio(port, data, timer):
+    # Long-polls the audio job like the browser does, then downloads the file
+    start = time.perf_counter()
+    url = data.get('audio_url')
+    status_url = data.get('audio_status_url')
+    while not url and status_url:
+        status, body = fetch(port, 'GET', f"{status_url}?wait=20")
+        if status == 200:
+            url = json.loads(body)['audio_url']
+        elif status != 202 or time.perf_counter() - start > 120:
+            return status or 0
+    status, audio = fetch(port, 'GET', url)
+    timer.record('audio_ready', time.perf_counter() - start)
+    return status if audio else 0
+
+
+def stream_request(port, rng, timer):
+    # Reads the SSE reply while a second connection plays the sentence audio stream it announces
+    conn = HTTPConnection('127.0.0.1', port, timeout=120)
+    audio = {}
+    player = None
+
+    def play(url):
+        audio['status'], audio['body'] = fetch(port, 'GET', url)
+
+    try:
+        conn.request('POST', '/api/chat/stream', body=chat_message(rng), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        if response.status != 200:
+            response.read()
+            return response.status, None
+        start = time.perf_counter()
+        failed = False
+        for line in iter(response.readline, b''):
+            if not line.startswith(b'data: '):
+                continue
+            event = json.loads(line[6:])
+            if event['type'] == 'audio_stream':
+                player = threading.Thread(target=play, args=(event['url'],))
+                player.start()
+            elif event['type'] == 'error':
+                failed = True
+    finally:
+        conn.close()
+    if failed:
+        return 500, None
+
+    def audio_stream():
+        if player is None:
+            return 0
+        player.join()
+        timer.record('audio_stream', time.perf_counter() - start)
+        return audio['status'] if audio.get('body') else 0
+
+    return 200, audio_stream
+
+
+def transcribe_request(port, rng, timer):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="input.webm"\r\n'
+            f'Content-Type: audio/webm\r\n\r\n').encode() + os.urandom(2048) + f'\r\n--{boundary}--\r\n'.encode()
+    status, _ = fetch(port, 'POST', '/api/transcribe', body,
+                      {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    return status, None
+
+
+def drive(port, args, timer):
+    rng = random.Random(args.seed)
+    endpoints = {'chat': chat_request, 'stream': stream_request, 'transcribe': transcribe_request}
+
+    def pick():
+        r = rng.random()
+        if r < args.transcribe_ratio:
+            return 'transcribe'
+        return 'stream' if r < args.transcribe_ratio + args.stream_ratio else 'chat'
+
+    plan = [pick() for _ in range(args.requests)]
+    errors = defaultdict(int)
+
+    def one(kind):
+        # The request is timed on its own; the audio that follows it is timed and checked separately
+        start = time.perf_counter()
+        try:
+            status, follow_up = endpoints[kind](port, rng, timer)
+        except Exception:
+            status, follow_up = 0, None
+        timer.record(f'request_{kind}', time.perf_counter() - start)
+        if status >= 400 or status == 0:
+            errors[kind] += 1
+        if follow_up:
+            try:
+                status = follow_up()
+            except Exception:
+                status = 0
+            if status >= 400 or status == 0:
+                errors[f'{kind}_audio'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, plan))
+    return time.perf_counter() - started, dict(errors)
+
+
+def result_for(args, label, elapsed, errors, timer, **extra):
+    config = {k: getattr(args, k) for k in ('requests', 'concurrency', 'llm_latency', 'tokens_per_second',
+                                            'tts_latency', 'whisper_latency', 'transcribe_ratio', 'stream_ratio',
+                                            'seed')}
+    config.update(extra)
+    return {
+        'label': label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': config,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(args.requests / elapsed, 2),
+        'errors': errors,
+        'stages': {stage: summarize(samples) for stage, samples in sorted(timer.samples.items())},
+    }
+
+
+def run(args):
+    original_dir = os.getcwd()
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    try:
+        moira = load_app(args)
+        timer = StageTimer()
+        instrument(moira, timer)
+        server = start_server(moira)
+        elapsed, errors = drive(server.server_port, args, timer)
+        # Background audio jobs finish after the responses; wait so TTS timings are complete
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            stats = moira.audio_jobs.stats()
+            if not stats['queue_depth'] and not stats['running']:
+                break
+            time.sleep(0.05)
+        server.shutdown()
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result_for(args, args.label, elapsed, errors, timer)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            conn = HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/audio/queue')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def run_gunicorn(args, workers):
+    # Only end-to-end request latencies are measured here; stages run inside the worker processes
+    workdir = prepare_workdir()
+    port = free_port()
+    env = dict(os.environ, **fake_environment(args))
+    env.update({
+        'PYTHONPATH': os.pathsep.join([REPO_DIR, os.path.join(REPO_DIR, 'benchmarks')]),
+        'MOIRA_WORKERS': str(workers),
+        'MOIRA_THREADS': str(args.threads),
+        'MOIRA_BIND': f'127.0.0.1:{port}',
+    })
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+               '--access-logfile', '/dev/null', 'fake_wsgi:app']
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(port, process)
+        timer = StageTimer()
+        elapsed, errors = drive(port, args, timer)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result_for(args, f"{args.label}-{workers}w", elapsed, errors, timer, workers=workers, threads=args.threads)
+
+
+def print_report(result, baseline=None):
+    print(f"\n{result['label']}: {result['config']['requests']} requests at concurrency "
+          f"{result['config']['concurrency']} in {result['elapsed_s']}s ({result['throughput_rps']} req/s)")
+    if result['errors']:
+        print(f"errors: {result['errors']}")
+    print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in result['stages'].items():
+        line = f"{stage:<22}{s['count']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        old = (baseline or {}).get('stages', {}).get(stage)
+        if old and old['p95_ms']:
+            line += f"   p95 {((s['p95_ms'] - old['p95_ms']) / old['p95_ms']) * 100:+.1f}% vs {baseline['label']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--tts-latency', type=float, default=0.2)
+    parser.add_argument('--whisper-latency', type=float, default=0.3)
+    parser.add_argument('--transcribe-ratio', type=float, default=0.2, help='share of requests sent to /api/transcribe')
+    parser.add_argument('--stream-ratio', type=float, default=0.3, help='share of requests sent to /api/chat/stream')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--compare', help='previous result JSON to compare p95s against')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--gunicorn-workers', help='comma-separated worker counts, e.g. 1,2,4')
+    parser.add_argument('--threads', type=int, default=2, help='threads per gunicorn worker')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    if args.gunicorn_workers:
+        results = [run_gunicorn(args, int(n)) for n in args.gunicorn_workers.split(',')]
+    else:
+        results = [run(args)]
+    for result in results:
+        print_report(result, baseline)
+        if not args.no_save:
+            save_result(result)
+    if len(results) > 1:
+        base = results[0]['throughput_rps']
+        print("\nworkers  req/s  speedup")
+        for result in results:
+            print(f"{result['config']['workers']:>7}  {result['throughput_rps']:>5}  {result['throughput_rps'] / base:>6.2f}x")
+
+
+def save_result(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{result['label']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,172 @@
+import argparse
 import os
 import json
+import shutil
+from conversation_store import ConversationStore
+from health_store import HealthStore
+from search_index import SearchIndex
+from retention import Retention, default_policies, format_bytes, summarize
 
 # Paths to clear
 MEMORY_FILE = 'memory/memory.json'
+CONVERSATION_DB = 'memory/conversations.db'
+ARCHIVE_DIR = 'memory/archive'
+HEALTH_DB = 'memory/health.db'
+SEARCH_DB = 'memory/search.db'
 HEALTH_BUFFER_FILE = 'documents/health_buffer.json'
 HEALTH_RECORDS_FILE = 'documents/health_records.json'
 FAMILY_DIR = 'family'
+DOCUMENTS_DIR = 'documents'
+LOGS_DIR = 'logs'
+AUDIO_DIR = 'static/audio'
+RETENTION_LOCK_FILE = 'memory/.retention.lock'
 
-# Clear memory.json
-os.makedirs('memory', exist_ok=True)
-with open(MEMORY_FILE, 'w') as f:
-    json.dump({"conversations": []}, f, indent=2)
-print(f"Cleared {MEMORY_FILE}")
-
-# Clear health_buffer.json
-os.makedirs('documents', exist_ok=True)
-with open(HEALTH_BUFFER_FILE, 'w') as f:
-    json.dump([], f, indent=2)
-print(f"Cleared {HEALTH_BUFFER_FILE}")
-
-# Clear health_records.json
-with open(HEALTH_RECORDS_FILE, 'w') as f:
-    json.dump([], f, indent=2)
-print(f"Cleared {HEALTH_RECORDS_FILE}")
-
-# Delete all .json files in family directory
-os.makedirs(FAMILY_DIR, exist_ok=True)
-for filename in os.listdir(FAMILY_DIR):
-    if filename.endswith('.json'):
-        path = os.path.join(FAMILY_DIR, filename)
-        try:
-            os.remove(path)
-            print(f"Deleted {path}")
-        except Exception as e:
-            print(f"Failed to delete {path}: {e}")
-
-print("All Moira memory and records cleared.") 
\ No newline at end of file
+# Cleared when no --only is given; documents, logs and audio are only cleared when named
+DEFAULT_TARGETS = ['conversations', 'archive', 'health', 'search', 'family']
+
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def report(path, dry_run, action='Cleared'):
+    if dry_run:
+        print(f"Would clear {path} ({format_bytes(size_of(path)) if os.path.exists(path) else 'missing'})")
+    else:
+        print(f"{action} {path}")
+
+
+def delete_files(directory, keep, dry_run):
+    os.makedirs(directory, exist_ok=True)
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not keep(filename) and os.path.isfile(path):
+            if dry_run:
+                print(f"Would delete {path} ({format_bytes(os.path.getsize(path))})")
+                continue
+            try:
+                os.remove(path)
+                print(f"Deleted {path}")
+            except Exception as e:
+                print(f"Failed to delete {path}: {e}")
+
+
+def clear_conversations(dry_run):
+    # Clear memory.json
+    report(MEMORY_FILE, dry_run)
+    report(CONVERSATION_DB, dry_run)
+    if dry_run:
+        return
+    os.makedirs('memory', exist_ok=True)
+    with open(MEMORY_FILE, 'w') as f:
+        json.dump({"conversations": []}, f, indent=2)
+    # Clear the conversation store (marking the legacy file as already migrated)
+    store = ConversationStore(CONVERSATION_DB, legacy_file=MEMORY_FILE)
+    store.clear()
+
+
+def clear_archive(dry_run):
+    # Delete archived conversation segments
+    if os.path.isdir(ARCHIVE_DIR):
+        report(ARCHIVE_DIR, dry_run, 'Deleted')
+        if not dry_run:
+            shutil.rmtree(ARCHIVE_DIR)
+
+
+def clear_health(dry_run):
+    for path in (HEALTH_BUFFER_FILE, HEALTH_RECORDS_FILE, HEALTH_DB):
+        report(path, dry_run)
+    if dry_run:
+        return
+    # Clear health_buffer.json and health_records.json
+    os.makedirs('documents', exist_ok=True)
+    for path in (HEALTH_BUFFER_FILE, HEALTH_RECORDS_FILE):
+        with open(path, 'w') as f:
+            json.dump([], f, indent=2)
+    # Clear the health store (marking the legacy files as already migrated)
+    health = HealthStore(HEALTH_DB, legacy_buffer=HEALTH_BUFFER_FILE, legacy_records=HEALTH_RECORDS_FILE)
+    health.clear()
+
+
+def clear_search(dry_run):
+    report(SEARCH_DB, dry_run)
+    if not dry_run:
+        SearchIndex(SEARCH_DB).clear()
+
+
+def clear_family(dry_run):
+    # Delete all .json files in family directory
+    delete_files(FAMILY_DIR, lambda name: not name.endswith('.json'), dry_run)
+
+
+def clear_documents(dry_run):
+    # Generated documents only; the legacy health files are handled with 'health'
+    delete_files(DOCUMENTS_DIR, lambda name: name.endswith('.json'), dry_run)
+
+
+def clear_logs(dry_run):
+    if os.path.isdir(LOGS_DIR):
+        report(LOGS_DIR, dry_run, 'Deleted')
+        if not dry_run:
+            shutil.rmtree(LOGS_DIR)
+            os.makedirs(LOGS_DIR)
+
+
+def clear_audio(dry_run):
+    delete_files(AUDIO_DIR, lambda name: not name.endswith('.mp3'), dry_run)
+
+
+TARGETS = {
+    'conversations': clear_conversations,
+    'archive': clear_archive,
+    'health': clear_health,
+    'search': clear_search,
+    'family': clear_family,
+    'documents': clear_documents,
+    'logs': clear_logs,
+    'audio': clear_audio,
+}
+
+
+def run_retention(dry_run):
+    retention = Retention(default_policies(), lock_file=RETENTION_LOCK_FILE)
+    for policy in retention.policies:
+        print(f"{policy.name} ({policy.directory}): {policy.describe()}")
+    results = retention.run(dry_run=dry_run)
+    for name, result in results.items():
+        for action, path, size in result['actions']:
+            done = {'delete': 'Deleted', 'compress': 'Compressed'}[action]
+            print(f"{'Would ' + action if dry_run else done} {path} ({format_bytes(size)})")
+    print(summarize(results, dry_run=dry_run))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clear Moira's memory and records, or apply the retention limits.")
+    parser.add_argument('--only', help=f"comma-separated targets to clear ({', '.join(TARGETS)}); "
+                                       f"default: {', '.join(DEFAULT_TARGETS)}")
+    parser.add_argument('--retention', action='store_true',
+                        help="apply the retention policies (MOIRA_RETENTION_* limits) instead of clearing everything")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be removed without changing anything")
+    args = parser.parse_args()
+
+    if args.retention:
+        run_retention(args.dry_run)
+        return
+    targets = [t.strip() for t in args.only.split(',') if t.strip()] if args.only else DEFAULT_TARGETS
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+    for target in targets:
+        TARGETS[target](args.dry_run)
+    if args.dry_run:
+        print("Dry run: nothing was changed.")
+    elif targets == DEFAULT_TARGETS:
+        print("All Moira memory and records cleared.")
+    else:
+        print(f"Cleared {', '.join(targets)}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Conversation history backed by SQLite in WAL mode, with older turns compacted into summaries and archived."""
+import json
+import os
+
+from storage import SQLiteStore, atomic_write_json
+
+
+class ConversationStore(SQLiteStore):
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            user TEXT NOT NULL,
+            assistant TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations (timestamp);
+        CREATE TABLE IF NOT EXISTS summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            segment TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            rolling TEXT NOT NULL
+        );
+    '''
+
+    def __init__(self, path, legacy_file=None):
+        super().__init__(path)
+        if legacy_file:
+            self.migrate_legacy(legacy_file)
+
+    def migrate_legacy(self, legacy_file):
+        # One-time import of the old memory.json {"conversations": [...]} format
+        if self.get_meta('legacy_migrated') or not os.path.exists(legacy_file):
+            return 0
+        try:
+            with open(legacy_file, 'r') as f:
+                conversations = json.load(f).get('conversations', [])
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Moira] Could not read {legacy_file} for migration: {e}")
+            conversations = []
+        with self.transaction() as conn:
+            # Another worker process may have finished the import while the file was being read
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                return 0
+            conn.executemany(
+                'INSERT INTO conversations (timestamp, user, assistant) VALUES (?, ?, ?)',
+                [(c.get('timestamp', ''), c.get('user', ''), c.get('assistant', '')) for c in conversations]
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', ?)", (legacy_file,))
+        if conversations:
+            print(f"[Moira] Migrated {len(conversations)} conversations from {legacy_file}")
+        return len(conversations)
+
+    def append(self, user, assistant, timestamp):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO conversations (timestamp, user, assistant) VALUES (?, ?, ?)',
+                (timestamp, user, assistant)
+            )
+            return cursor.lastrowid
+
+    def recent(self, n=5):
+        rows = self.connection().execute(
+            'SELECT id, timestamp, user, assistant FROM conversations ORDER BY id DESC LIMIT ?', (n,)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def get(self, turn_id):
+        row = self.connection().execute(
+            'SELECT id, timestamp, user, assistant FROM conversations WHERE id = ?', (turn_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def recent_until(self, turn_id, n=5):
+        # The n turns ending at turn_id, oldest first
+        rows = self.connection().execute(
+            'SELECT id, timestamp, user, assistant FROM conversations WHERE id <= ? ORDER BY id DESC LIMIT ?', (turn_id, n)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def last(self):
+        turns = self.recent(1)
+        return turns[0] if turns else None
+
+    def iter_all(self):
+        cursor = self.connection().execute('SELECT id, timestamp, user, assistant FROM conversations ORDER BY id')
+        for row in cursor:
+            yield dict(row)
+
+    def iter_range(self, since=None, until=None, contains=None):
+        # Streams hot turns in order, filtered by timestamp range and a case-insensitive substring
+        query = 'SELECT id, timestamp, user, assistant FROM conversations WHERE 1 = 1'
+        params = []
+        if since:
+            query += ' AND timestamp >= ?'
+            params.append(since)
+        if until:
+            query += ' AND timestamp <= ?'
+            params.append(until)
+        if contains:
+            query += " AND (user LIKE ? ESCAPE '\\' OR assistant LIKE ? ESCAPE '\\')"
+            pattern = '%' + contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            params.extend([pattern, pattern])
+        for row in self.connection().execute(query + ' ORDER BY id', params):
+            yield dict(row)
+
+    def count(self):
+        return self.connection().execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+
+    def compactable(self, hot_turns, batch):
+        # The oldest `batch` turns once the hot set has grown to hot_turns + batch, else []
+        if self.count() < hot_turns + batch:
+            return []
+        rows = self.connection().execute(
+            'SELECT id, timestamp, user, assistant FROM conversations ORDER BY id LIMIT ?', (batch,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def archive(self, turns, summary, rolling, archive_dir):
+        # The segment is written before the turns are deleted, under a name fixed by its turn ids,
+        # so a crash in between just rewrites the same segment on the next run
+        first, last = turns[0], turns[-1]
+        segment = f"{first['timestamp'][:10] or 'undated'}_{first['id']}-{last['id']}.json"
+        os.makedirs(archive_dir, exist_ok=True)
+        atomic_write_json(os.path.join(archive_dir, segment), {'summary': summary, 'turns': turns}, indent=2)
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO summaries (first_id, last_id, start_time, end_time, segment, summary, rolling) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (first['id'], last['id'], first['timestamp'], last['timestamp'], segment, summary, rolling)
+            )
+            conn.execute('DELETE FROM conversations WHERE id BETWEEN ? AND ?', (first['id'], last['id']))
+        return segment
+
+    def long_term_summary(self):
+        row = self.connection().execute('SELECT rolling FROM summaries ORDER BY id DESC LIMIT 1').fetchone()
+        return row['rolling'] if row else ''
+
+    def summaries(self, since=None, until=None):
+        # Archived periods overlapping [since, until]
+        query = 'SELECT id, first_id, last_id, start_time, end_time, segment, summary FROM summaries WHERE 1 = 1'
+        params = []
+        if since:
+            query += ' AND end_time >= ?'
+            params.append(since)
+        if until:
+            query += ' AND start_time <= ?'
+            params.append(until)
+        rows = self.connection().execute(query + ' ORDER BY id', params).fetchall()
+        return [dict(row) for row in rows]
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM conversations')
+            conn.execute('DELETE FROM summaries')
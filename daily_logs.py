@@ -0,0 +1,230 @@
+"""Durable per-day conversation logs with a date index, range queries and cached day summaries."""
+import bisect
+import gzip
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import dateparser
+
+# Finished days may have been gzipped by the retention job
+DATE_FILE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})\.txt(?:\.gz)?$')
+ENTRY_RE = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (User|Moira): ?(.*)$')
+MAX_QUEUED_SUMMARIES = 31
+
+
+def format_entry(entry):
+    # Continuation lines are indented so quoted log text can never look like the start of an entry
+    user = entry['user'].replace('\n', '\n  ')
+    assistant = entry['assistant'].replace('\n', '\n  ')
+    return (f"[{entry['timestamp']}] User: {user}\n"
+            f"[{entry['timestamp']}] Moira: {assistant}\n\n")
+
+
+def parse_entries(text):
+    # Reverse of format_entry; lines that don't start a new field continue the previous one
+    entries = []
+    current = None
+    field = None
+    for line in text.split('\n'):
+        match = ENTRY_RE.match(line)
+        if match:
+            timestamp, speaker, content = match.groups()
+            if speaker == 'User':
+                current = {'timestamp': timestamp, 'user': content, 'assistant': ''}
+                entries.append(current)
+                field = 'user'
+            elif current is not None:
+                current['assistant'] = content
+                field = 'assistant'
+        elif current is not None and field:
+            current[field] += '\n' + (line[2:] if line.startswith('  ') else line)
+    for entry in entries:
+        entry['user'] = entry['user'].rstrip()
+        entry['assistant'] = entry['assistant'].rstrip()
+    return entries
+
+
+def parse_log_range(phrase, today=None):
+    # Turn "yesterday", "last week", "since Monday", "last 3 days", "between June 1 and June 5" into (start, end) dates
+    today = today or datetime.now().date()
+    phrase = phrase.strip().lower().rstrip('?.! ')
+    settings = {'PREFER_DATES_FROM': 'past', 'RELATIVE_BASE': datetime.combine(today, datetime.min.time())}
+    if phrase in ('today', 'this morning', 'this afternoon', 'tonight'):
+        return today, today
+    if phrase == 'this week':
+        return today - timedelta(days=today.weekday()), today
+    if phrase in ('last week', 'the last week', 'the past week', 'past week'):
+        return today - timedelta(days=7), today
+    if phrase in ('this month', 'the past month', 'last month'):
+        if phrase == 'this month':
+            return today.replace(day=1), today
+        return today - timedelta(days=30), today
+    match = re.match(r'(?:the )?(?:last|past) (\d+) days?$', phrase)
+    if match:
+        return today - timedelta(days=int(match.group(1))), today
+    match = re.match(r'since (.+)$', phrase)
+    if match:
+        dt = dateparser.parse(match.group(1), settings=settings)
+        return (dt.date(), today) if dt else None
+    match = re.match(r'(?:between|from) (.+?) (?:and|to|until) (.+)$', phrase)
+    if match:
+        start = dateparser.parse(match.group(1), settings=settings)
+        end = dateparser.parse(match.group(2), settings=settings)
+        if start and end:
+            return min(start.date(), end.date()), max(start.date(), end.date())
+        return None
+    dt = dateparser.parse(phrase, settings=settings)
+    if dt:
+        return dt.date(), dt.date()
+    return None
+
+
+class DailyLogs:
+    def __init__(self, directory, summarize=None):
+        self.directory = directory
+        self.summary_dir = os.path.join(directory, 'summaries')
+        self.summarize = summarize
+        self.lock = threading.Lock()
+        # Days waiting for a background summary, and the thread working through them
+        self.pending = deque()
+        self.queued = set()
+        self.summarizer = None
+        os.makedirs(self.summary_dir, exist_ok=True)
+        # Sorted list of 'YYYY-MM-DD' strings for days that have a log file
+        self.dates = []
+        self.dir_mtime = None
+        self._refresh_dates()
+
+    def _refresh_dates(self):
+        # Another worker process may have started a new day's file; the directory mtime changes when it does
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime == self.dir_mtime:
+            return
+        dates = sorted({m.group(1) for m in map(DATE_FILE_RE.match, os.listdir(self.directory)) if m})
+        with self.lock:
+            self.dates = dates
+            self.dir_mtime = mtime
+
+    def path(self, date_str):
+        return os.path.join(self.directory, f"{date_str}.txt")
+
+    def append(self, entry):
+        # Each turn goes to its own day's file as a single O_APPEND write, fsynced before returning
+        date_str = entry['timestamp'][:10]
+        data = format_entry(entry).encode('utf-8')
+        fd = os.open(self.path(date_str), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self.lock:
+            index = bisect.bisect_left(self.dates, date_str)
+            if index == len(self.dates) or self.dates[index] != date_str:
+                self.dates.insert(index, date_str)
+
+    def existing_path(self, date_str):
+        # The plain file while the day is open, the .gz once it has been compressed
+        for path in (self.path(date_str), self.path(date_str) + '.gz'):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def read_day(self, date_str):
+        try:
+            with open(self.path(date_str), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        try:
+            with gzip.open(self.path(date_str) + '.gz', 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def dates_between(self, start, end):
+        start, end = str(start), str(end)
+        self._refresh_dates()
+        with self.lock:
+            lo = bisect.bisect_left(self.dates, start)
+            hi = bisect.bisect_right(self.dates, end)
+            return self.dates[lo:hi]
+
+    def entries_for_day(self, date_str):
+        text = self.read_day(date_str)
+        return parse_entries(text) if text else []
+
+    def iter_entries(self, start, end):
+        # Streams entries day by day; only the files inside the range are opened
+        for date_str in self.dates_between(start, end):
+            yield from self.entries_for_day(date_str)
+
+    def summary_path(self, date_str):
+        return os.path.join(self.summary_dir, f"{date_str}.txt")
+
+    def cached_summary(self, date_str):
+        path = self.summary_path(date_str)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        return None
+
+    def day_summary(self, date_str):
+        # Finished days are summarized once and cached; today's log is still growing so it is never cached
+        summary = self.cached_summary(date_str)
+        if summary is not None or self.summarize is None:
+            return summary
+        if date_str >= datetime.now().strftime("%Y-%m-%d"):
+            return None
+        text = self.read_day(date_str)
+        if not text:
+            return None
+        try:
+            summary = self.summarize(text)
+        except Exception as e:
+            print(f"[Moira] Failed to summarize log for {date_str}: {e}")
+            return None
+        fd, tmp = tempfile.mkstemp(dir=self.summary_dir, prefix='.tmp-', suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(summary)
+        os.replace(tmp, self.summary_path(date_str))
+        return summary
+
+    def queue_summaries(self, dates):
+        # Days recalled without a cached summary are summarized in the background so the next recall can use them;
+        # the request itself never waits for GPT
+        if self.summarize is None:
+            return
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.lock:
+            for date_str in dates:
+                if len(self.queued) >= MAX_QUEUED_SUMMARIES:
+                    break
+                if date_str < today and date_str not in self.queued:
+                    self.queued.add(date_str)
+                    self.pending.append(date_str)
+            if self.pending and self.summarizer is None:
+                self.summarizer = threading.Thread(target=self._summarize_pending, name='log-summaries', daemon=True)
+                self.summarizer.start()
+
+    def _summarize_pending(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.summarizer = None
+                    return
+                date_str = self.pending.popleft()
+            try:
+                self.day_summary(date_str)
+            finally:
+                with self.lock:
+                    self.queued.discard(date_str)
+
+    def summarize_day(self, date_str=None):
+        # Scheduled after midnight to pre-compute yesterday's summary
+        date_str = date_str or (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        return self.day_summary(date_str)
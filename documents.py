@@ -0,0 +1,85 @@
+"""Generators that render Moira's downloadable documents line by line, with an optional atomic copy on disk."""
+import os
+import tempfile
+
+BUFFER_SIZE = 16 * 1024
+
+
+def doctor_summary(person, since, summaries, turns):
+    yield f"Doctor Summary for {person}\n"
+    yield f"Since last visit on {since or 'N/A'}:\n\n"
+    for s in summaries:
+        yield f"- {s['start_time']} to {s['end_time']}: {s['summary']}\n"
+    for turn in turns:
+        yield f"- {turn['timestamp']}: {turn['user']} / {turn['assistant']}\n"
+
+
+def medical_summary(patient, generated_at, counts, issues):
+    # counts is {status: n}, so the header can be written before the issues are read
+    yield f"Medical Summary for {patient}\n"
+    yield f"Generated on: {generated_at}\n"
+    yield "=" * 40 + "\n\n"
+    if not sum(counts.values()):
+        yield "No health issues recorded for this patient.\n"
+        return
+    yield f"Ongoing issues: {counts.get('ongoing', 0)}\n"
+    yield f"Resolved issues: {counts.get('resolved', 0)}\n\n"
+    for issue in issues:
+        yield f"Date: {issue['date']}\n"
+        yield f"Status: {issue['status'].capitalize()}\n"
+        yield f"Description: {issue['description']}\n"
+        for upd in issue.get('updates') or []:
+            yield f"  Update ({upd['date']}): {upd['update']}\n"
+        if issue.get('resolved_date'):
+            yield f"Resolved on: {issue['resolved_date']}\n"
+        yield "-" * 30 + "\n"
+
+
+def schedule(period, turns):
+    yield f"{period.capitalize()} Schedule\n\n"
+    for turn in turns:
+        yield f"- {turn['timestamp']}: {turn['user']}\n"
+
+
+def dialogue_export(turn):
+    yield f"User: {turn['user']}\n\nMoira: {turn['assistant']}\n"
+
+
+def buffered(chunks, size=BUFFER_SIZE):
+    # Joins small pieces so a streamed response isn't one network write per line
+    parts, length = [], 0
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+def tee_to_file(chunks, path):
+    # Passes chunks through while writing them to a temp file that replaces path only once the document is complete
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        # Includes GeneratorExit when a download is abandoned part way
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def save(chunks, path):
+    for _ in tee_to_file(chunks, path):
+        pass
+    return path
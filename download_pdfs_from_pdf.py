@@ -1,13 +1,31 @@
+import argparse
+import hashlib
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote, urlparse
+
 import requests
-from PyPDF2 import PdfReader
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from extraction import file_hash
+from ingestion import load_json
+from storage import atomic_write_json
 
 PDF_FILE = "Autism Research Data Links_.pdf"
-OUTPUT_DIR = "research/links_downloaded"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+RESEARCH_DIR = "research"
+# New files land where the ingestion queue picks them up
+OUTPUT_DIR = RESEARCH_DIR
+STATE_FILE = os.path.join(RESEARCH_DIR, "download_state.json")
+RESEARCH_EXTENSIONS = ('.pdf', '.txt')
+SKIP_DIRS = {'text_cache'}
+CHUNK_SIZE = 64 * 1024
+
 
 def extract_pdf_links(pdf_path):
+    from PyPDF2 import PdfReader
     reader = PdfReader(pdf_path)
     links = set()
     for page in reader.pages:
@@ -17,22 +35,177 @@ def extract_pdf_links(pdf_path):
         # Only keep .pdf links
         pdf_urls = [url for url in urls if url.lower().endswith('.pdf')]
         links.update(pdf_urls)
-    return list(links)
-
-def download_pdf(url, output_dir):
-    local_filename = os.path.join(output_dir, url.split('/')[-1])
-    try:
-        with requests.get(url, stream=True, timeout=30) as r:
-            r.raise_for_status()
-            with open(local_filename, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        print(f"Downloaded: {local_filename}")
-    except Exception as e:
-        print(f"Failed to download {url}: {e}")
+    return sorted(links)
 
-if __name__ == "__main__":
-    links = extract_pdf_links(PDF_FILE)
+
+def range_total(content_range):
+    # "bytes */12345" or "bytes 0-99/12345" -> 12345
+    match = re.match(r'bytes [^/]+/(\d+)$', (content_range or '').strip())
+    return int(match.group(1)) if match else None
+
+
+def make_session(workers):
+    # One pooled session for every download, so connections to the same host are reused
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'Moira research downloader'
+    return session
+
+
+class Downloader:
+    def __init__(self, output_dir=OUTPUT_DIR, research_dir=RESEARCH_DIR, state_file=STATE_FILE, workers=4,
+                 timeout=30, session=None, refresh=False):
+        self.output_dir = output_dir
+        self.research_dir = research_dir
+        self.state_file = state_file
+        self.workers = workers
+        self.timeout = timeout
+        self.refresh = refresh
+        self.session = session or make_session(workers)
+        self.lock = threading.Lock()
+        # {"urls": {url: {etag, last_modified, sha256, file, partial}}, "files": {path: {size, mtime, sha256}}}
+        self.state = load_json(state_file, {})
+        self.state.setdefault('urls', {})
+        self.state.setdefault('files', {})
+        os.makedirs(output_dir, exist_ok=True)
+        self.known = self.index_research()
+
+    def save_state(self):
+        with self.lock:
+            atomic_write_json(self.state_file, self.state, indent=2)
+
+    def index_research(self):
+        # sha256 -> path for every research file; hashes are reused while size and mtime are unchanged
+        known = {}
+        files = {}
+        for root, dirs, names in os.walk(self.research_dir):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            for name in names:
+                if not name.lower().endswith(RESEARCH_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                cached = self.state['files'].get(path)
+                if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+                    digest = cached['sha256']
+                else:
+                    digest = file_hash(path)
+                files[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest}
+                known.setdefault(digest, path)
+        self.state['files'] = files
+        return known
+
+    def destination(self, url, digest):
+        # Keep the URL's file name unless a different document already uses it
+        name = unquote(os.path.basename(urlparse(url).path)) or 'download.pdf'
+        name = re.sub(r'[^\w.\- ]', '_', name)
+        path = os.path.join(self.output_dir, name)
+        if os.path.exists(path):
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(self.output_dir, f"{stem}-{digest[:8]}{ext}")
+        return path
+
+    def download(self, url):
+        with self.lock:
+            entry = dict(self.state['urls'].get(url, {}))
+        complete = bool(entry.get('sha256'))
+        if complete and not self.refresh and not (entry.get('etag') or entry.get('last_modified')):
+            # Nothing to revalidate with; the content was already fetched once
+            return 'unchanged', url
+        part = os.path.join(self.output_dir, f".{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.part")
+        headers = {}
+        offset = os.path.getsize(part) if os.path.exists(part) and entry.get('partial') else 0
+        if offset:
+            # Resume only if the server still has the same version of the file
+            headers['Range'] = f"bytes={offset}-"
+            validator = entry.get('etag') or entry.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        elif complete and not self.refresh:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as r:
+            if r.status_code == 304:
+                return 'unchanged', url
+            stale = r.status_code == 416 and offset and range_total(r.headers.get('Content-Range')) != offset
+            if r.status_code == 416 and offset and not stale:
+                # Every byte arrived last time, but the run stopped before the file was finished off
+                resumed = True
+            elif not stale:
+                r.raise_for_status()
+                resumed = r.status_code == 206
+                entry.update({'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified'),
+                              'partial': True})
+                with self.lock:
+                    self.state['urls'][url] = dict(entry)
+                # On disk before the body streams, so a killed run can resume from the .part file
+                self.save_state()
+                with open(part, 'ab' if resumed else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+        if stale:
+            # The partial file doesn't match what the server has now; fetch it again from the start
+            os.remove(part)
+            return self.download(url)
+
+        digest = file_hash(part)
+        entry['partial'] = False
+        entry['sha256'] = digest
+        with self.lock:
+            existing = self.known.get(digest)
+            if existing:
+                os.remove(part)
+                entry['file'] = existing
+                result = 'duplicate'
+            else:
+                path = self.destination(url, digest)
+                os.replace(part, path)
+                self.known[digest] = path
+                entry['file'] = path
+                result = 'resumed' if resumed else 'downloaded'
+            self.state['urls'][url] = entry
+        return result, entry['file']
+
+    def run(self, urls):
+        counts = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='download') as pool:
+            futures = {pool.submit(self.download, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    result, detail = future.result()
+                    print(f"{result.capitalize()}: {url}" + (f" -> {detail}" if detail != url else ''))
+                except Exception as e:
+                    result = 'failed'
+                    print(f"Failed to download {url}: {e}")
+                counts[result] = counts.get(result, 0) + 1
+                self.save_state()
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download research PDFs linked from a PDF (or a list of URLs) into research/.")
+    parser.add_argument('urls', nargs='*', help="URLs to download instead of the links in --pdf")
+    parser.add_argument('--pdf', default=PDF_FILE)
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    parser.add_argument('--research-dir', default=RESEARCH_DIR)
+    parser.add_argument('--state', default=STATE_FILE)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--refresh', action='store_true', help="ignore saved validators and fetch everything again")
+    args = parser.parse_args()
+
+    links = args.urls or extract_pdf_links(args.pdf)
     print(f"Found {len(links)} PDF links.")
-    for link in links:
-        download_pdf(link, OUTPUT_DIR) 
\ No newline at end of file
+    downloader = Downloader(args.output, args.research_dir, args.state, workers=args.workers, refresh=args.refresh)
+    counts = downloader.run(links)
+    print(', '.join(f"{count} {result}" for result, count in sorted(counts.items())) or 'Nothing to do.')
+
+
+if __name__ == "__main__":
+    main()
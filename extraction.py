@@ -0,0 +1,166 @@
+"""Research text extraction in killable worker processes, with a compressed content-addressed text cache."""
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import metrics
+
+
+class ExtractionError(Exception):
+    # transient: the worker timed out or died, which may just be load, so a later scan can try again
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+def extract_text(filepath):
+    if filepath.endswith(".txt"):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    elif filepath.endswith(".pdf"):
+        try:
+            from PyPDF2 import PdfReader
+            reader = PdfReader(filepath)
+            return "\n".join([page.extract_text() or "" for page in reader.pages])
+        except Exception as e:
+            print(f"[Moira] Failed to extract PDF: {filepath}: {e}")
+            return ""
+    else:
+        return ""
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _extract_worker(path, conn):
+    try:
+        conn.send(('ok', extract_text(path)))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
+
+
+class TextCache:
+    # <sha256>.txt.gz holds the text of each extracted document; <sha256>.failed records a failed extraction
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _write(self, final, write):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, final)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def has(self, key):
+        return os.path.exists(self.path(key, '.txt.gz'))
+
+    def put(self, key, text):
+        data = text.encode('utf-8')
+        self._write(self.path(key, '.txt.gz'), lambda f: f.write(gzip.compress(data, compresslevel=6)))
+        failed = self.path(key, '.failed')
+        if os.path.exists(failed):
+            os.remove(failed)
+
+    def get(self, key):
+        try:
+            with gzip.open(self.path(key, '.txt.gz'), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def failure(self, key):
+        # {'error', 'attempts', 'permanent'} for content that failed to extract before, else None
+        path = self.path(key, '.failed')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        try:
+            return json.loads(text)
+        except ValueError:
+            # Plain-text markers predate retry counts
+            return {'error': text, 'attempts': 1, 'permanent': True}
+
+    def mark_failed(self, key, error, attempts=1, permanent=True):
+        data = json.dumps({'error': str(error), 'attempts': attempts, 'permanent': permanent})
+        self._write(self.path(key, '.failed'), lambda f: f.write(data.encode('utf-8')))
+
+
+class Extractor:
+    def __init__(self, cache_dir, workers=2, timeout=120, max_attempts=3):
+        self.cache = TextCache(cache_dir)
+        self.timeout = timeout
+        # Timeouts and crashed workers are retried on later scans until this many attempts have failed
+        self.max_attempts = max_attempts
+        # Bounds how many extraction processes run at once across all callers
+        self.slots = threading.BoundedSemaphore(workers)
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+    def _run(self, path):
+        # One process per document so a pathological PDF can be killed without affecting other work
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=_extract_worker, args=(path, sender), daemon=True)
+        with self.slots:
+            process.start()
+            sender.close()
+            try:
+                if not receiver.poll(self.timeout):
+                    raise ExtractionError(f"timed out after {self.timeout}s", transient=True)
+                status, result = receiver.recv()
+            except EOFError:
+                raise ExtractionError(f"extraction process exited with code {process.exitcode}", transient=True)
+            finally:
+                receiver.close()
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        if status != 'ok':
+            raise ExtractionError(result)
+        return result
+
+    def extract(self, path, digest=None, retry_failed=False):
+        # Returns the document's text, from the cache when this exact content was extracted before
+        if path.endswith('.txt'):
+            return extract_text(path)
+        digest = digest or file_hash(path)
+        text = self.cache.get(digest)
+        if text is not None:
+            metrics.CACHE_REQUESTS.inc(cache='extracted_text', result='hit')
+            return text
+        metrics.CACHE_REQUESTS.inc(cache='extracted_text', result='miss')
+        failure = self.cache.failure(digest)
+        if failure and not retry_failed and (failure['permanent'] or failure['attempts'] >= self.max_attempts):
+            raise ExtractionError(f"previously failed: {failure['error']}")
+        try:
+            with metrics.span('extract_text'):
+                text = self._run(path)
+        except ExtractionError as e:
+            attempts = (failure['attempts'] if failure else 0) + 1
+            self.cache.mark_failed(digest, e, attempts=attempts, permanent=not e.transient)
+            raise
+        if text.strip():
+            # Empty results aren't cached so they are retried once a PDF reader is available
+            self.cache.put(digest, text)
+        return text
@@ -0,0 +1,133 @@
+"""In-memory cache of family profiles, invalidated by file modification times."""
+import json
+import os
+import threading
+import time
+
+from locks import file_lock
+from storage import atomic_write_json
+
+CONTEXT_FIELDS = [
+    ('diagnoses', 'diagnoses'),
+    ('triggers', 'triggers'),
+    ('preferences', 'preferences'),
+    ('favorite_things', 'loves'),
+]
+
+
+def profile_filename(name):
+    return f"{name.replace(' ', '_').lower()}.json"
+
+
+class FamilyRegistry:
+    def __init__(self, directory, on_change=None, check_interval=2.0):
+        self.directory = directory
+        self.on_change = on_change
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.profiles = {}   # filename -> (mtime_ns, profile)
+        self.version = 0
+        self.last_check = 0.0
+        self.context_cache = (None, None, '')
+        os.makedirs(directory, exist_ok=True)
+
+    def refresh(self, force=False):
+        # Stat-only check (at most every check_interval seconds); files are re-parsed only when they changed
+        now = time.monotonic()
+        with self.lock:
+            if not force and self.version and now - self.last_check < self.check_interval:
+                return False
+            self.last_check = now
+            changed = False
+            seen = set()
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(filename)
+                cached = self.profiles.get(filename)
+                if cached and cached[0] == mtime:
+                    continue
+                try:
+                    with open(path, 'r') as f:
+                        self.profiles[filename] = (mtime, json.load(f))
+                    changed = True
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"[Moira] Could not read family profile {path}: {e}")
+            for filename in set(self.profiles) - seen:
+                del self.profiles[filename]
+                changed = True
+            if changed or not self.version:
+                self.version += 1
+        if changed and self.on_change:
+            self.on_change()
+        return changed
+
+    def all(self, refresh=True):
+        if refresh:
+            self.refresh()
+        with self.lock:
+            return [profile for _, profile in sorted(self.profiles.values(), key=lambda p: p[1].get('name', ''))]
+
+    def get(self, name):
+        self.refresh()
+        with self.lock:
+            cached = self.profiles.get(profile_filename(name))
+            if cached:
+                return cached[1]
+            # Fall back to a first-name match ("Amelia" for "Amelia Smith")
+            wanted = name.strip().lower()
+            for _, profile in self.profiles.values():
+                full = (profile.get('name') or '').strip().lower()
+                if full == wanted or (full.split() and full.split()[0] == wanted):
+                    return profile
+        return None
+
+    def names(self):
+        return [p.get('name', '') for p in self.all() if p.get('name')]
+
+    def save(self, data):
+        filename = profile_filename(data['name'])
+        path = os.path.join(self.directory, filename)
+        # The file lock serializes writers across worker processes; readers only ever see whole files
+        with self.lock, file_lock(os.path.join(self.directory, '.lock')):
+            atomic_write_json(path, data, indent=2)
+            self.profiles[filename] = (os.stat(path).st_mtime_ns, data)
+            self.version += 1
+        if self.on_change:
+            self.on_change()
+        return path
+
+    def context_block(self, max_chars=1200):
+        # One compact line per family member for the system prompt, rebuilt only when a profile changes
+        profiles = self.all()
+        version, cached_chars, cached_block = self.context_cache
+        if version == self.version and cached_chars == max_chars:
+            return cached_block
+        lines = []
+        for profile in profiles:
+            name = profile.get('name')
+            if not name:
+                continue
+            details = []
+            if profile.get('pronouns'):
+                details.append(profile['pronouns'])
+            if profile.get('birthday'):
+                details.append(f"born {profile['birthday']}")
+            for field, label in CONTEXT_FIELDS:
+                values = [v for v in profile.get(field) or [] if v]
+                if values:
+                    details.append(f"{label}: {', '.join(values)}")
+            if profile.get('notes'):
+                details.append(f"notes: {profile['notes']}")
+            lines.append(f"- {name}" + (f" ({'; '.join(details)})" if details else ''))
+        block = '\n'.join(lines)
+        if len(block) > max_chars:
+            # Drop whole members rather than cutting one off mid-line
+            block = block[:max_chars].rsplit('\n', 1)[0] if '\n' in block[:max_chars] else block[:max_chars]
+        self.context_cache = (self.version, max_chars, block)
+        return block
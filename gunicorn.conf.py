@@ -0,0 +1,14 @@
+"""Gunicorn settings for serving Moira with several worker processes."""
+import os
+
+bind = os.getenv("MOIRA_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("MOIRA_WORKERS", "2"))
+# Threads let each worker keep serving while requests wait on OpenAI, ElevenLabs or Whisper
+worker_class = "gthread"
+threads = int(os.getenv("MOIRA_THREADS", "8"))
+# Streamed replies and long-polled audio jobs hold a request open for a while
+timeout = int(os.getenv("MOIRA_WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+# Each worker must import the app itself so its threads, SQLite connections and locks are its own
+preload_app = False
+accesslog = "-"
@@ -0,0 +1,92 @@
+"""Precompiled health keyword and patient name matcher."""
+import json
+import re
+import threading
+
+from rapidfuzz import fuzz, process
+
+FUZZY_THRESHOLD = 80  # percent similarity for a name match
+
+
+def load_vocabulary(path):
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[Moira] Could not load health vocabulary {path}: {e}")
+        data = {}
+    return data.get('keywords', []), data.get('names', [])
+
+
+class HealthMatcher:
+    def __init__(self, keywords=(), names=(), threshold=FUZZY_THRESHOLD):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.keywords = ()
+        self.names = ()
+        self.version = 0
+        self.keyword_re = None
+        self.canonical = {}
+        self.names_lower = []
+        self.set_vocabulary(keywords, names)
+
+    def set_vocabulary(self, keywords=None, names=None):
+        # Rebuilds the compiled pattern only when a vocabulary actually changed
+        keywords = tuple(dict.fromkeys(keywords)) if keywords is not None else self.keywords
+        names = tuple(dict.fromkeys(names)) if names is not None else self.names
+        with self.lock:
+            if keywords == self.keywords and names == self.names and self.keyword_re is not None:
+                return False
+            canonical = {}
+            for keyword in keywords:
+                canonical.setdefault(keyword.lower(), keyword)
+            # Longest first so multi-word phrases win over their prefixes ("eczema flare" before "eczema")
+            terms = sorted(canonical, key=len, reverse=True)
+            pattern = r'\b(?:' + '|'.join(re.escape(t) for t in terms) + r')\b' if terms else r'(?!x)x'
+            self.keyword_re = re.compile(pattern)
+            self.canonical = canonical
+            self.keywords = keywords
+            self.names = names
+            self.names_lower = [n.lower() for n in names]
+            self.version += 1
+            return True
+
+    def find_keywords(self, text):
+        found = {}
+        for match in self.keyword_re.finditer(text.lower()):
+            found.setdefault(self.canonical[match.group(0)], None)
+        return list(found)
+
+    def find_names(self, text):
+        # Best-scoring names first
+        if not self.names_lower:
+            return []
+        matches = process.extract(text.lower(), self.names_lower, scorer=fuzz.partial_ratio,
+                                  score_cutoff=self.threshold, limit=None)
+        return [self.names[index] for _, _, index in matches]
+
+    def detect(self, text):
+        keywords = self.find_keywords(text)
+        if not keywords:
+            return None, None, None
+        names = self.find_names(text)
+        return (names[0] if names else 'Unknown'), keywords, text
+
+
+def family_names(members):
+    # Match on full names and first names from family profiles
+    names = []
+    for member in members:
+        name = (member.get('name') or '').strip()
+        if name:
+            names.append(name)
+            first = name.split()[0]
+            if first != name:
+                names.append(first)
+    return names
+
+
+def refresh_matcher(matcher, vocabulary_file, members=()):
+    # Re-read the configured vocabulary and family names; keeps the current keywords if the config is unreadable
+    keywords, names = load_vocabulary(vocabulary_file)
+    return matcher.set_vocabulary(keywords or None, names + family_names(members))
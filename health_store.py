@@ -0,0 +1,172 @@
+"""Health issues with stable IDs and a per-patient date index, backed by SQLite."""
+import json
+import os
+
+from storage import SQLiteStore
+
+
+class HealthStore(SQLiteStore):
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS issues (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient TEXT NOT NULL,
+            patient_key TEXT NOT NULL,
+            description TEXT NOT NULL,
+            status TEXT NOT NULL,
+            date TEXT NOT NULL,
+            resolved_date TEXT
+        );
+        CREATE INDEX IF NOT EXISTS issues_patient_date ON issues (patient_key, date);
+        CREATE INDEX IF NOT EXISTS issues_status ON issues (status);
+        CREATE TABLE IF NOT EXISTS issue_updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            issue_id INTEGER NOT NULL REFERENCES issues (id) ON DELETE CASCADE,
+            date TEXT NOT NULL,
+            update_text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS issue_updates_issue ON issue_updates (issue_id, id);
+    '''
+
+    def __init__(self, path, legacy_buffer=None, legacy_records=None):
+        super().__init__(path)
+        if legacy_buffer or legacy_records:
+            self.migrate_legacy(legacy_buffer, legacy_records)
+
+    def migrate_legacy(self, buffer_file, records_file):
+        # One-time import of documents/health_buffer.json and health_records.json
+        if self.get_meta('legacy_migrated'):
+            return 0
+        entries = []
+        for path in (buffer_file, records_file):
+            if path and os.path.exists(path):
+                try:
+                    with open(path, 'r') as f:
+                        entries.extend(json.load(f))
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"[Moira] Could not read {path} for migration: {e}")
+        with self.transaction() as conn:
+            # Another worker process may have finished the import while the files were being read
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                return 0
+            for entry in entries:
+                issue_id = self._insert(conn, entry['patient'], entry['description'], entry.get('status', 'ongoing'),
+                                        entry['date'], entry.get('resolved_date'))
+                conn.executemany(
+                    'INSERT INTO issue_updates (issue_id, date, update_text) VALUES (?, ?, ?)',
+                    [(issue_id, u['date'], u['update']) for u in entry.get('updates', [])]
+                )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', '1')")
+        if entries:
+            print(f"[Moira] Migrated {len(entries)} health issues into {self.path}")
+        return len(entries)
+
+    def _insert(self, conn, patient, description, status, date, resolved_date=None):
+        cursor = conn.execute(
+            'INSERT INTO issues (patient, patient_key, description, status, date, resolved_date) VALUES (?, ?, ?, ?, ?, ?)',
+            (patient, patient.lower(), description, status, date, resolved_date)
+        )
+        return cursor.lastrowid
+
+    def add_issue(self, patient, description, status, date):
+        with self.transaction() as conn:
+            issue_id = self._insert(conn, patient, description, status, date)
+        return self.get_issue(issue_id)
+
+    def update_issue(self, issue_id, update_text, date, status=None):
+        with self.transaction() as conn:
+            if not conn.execute('SELECT 1 FROM issues WHERE id = ?', (issue_id,)).fetchone():
+                return None
+            conn.execute('INSERT INTO issue_updates (issue_id, date, update_text) VALUES (?, ?, ?)',
+                         (issue_id, date, update_text))
+            if status:
+                conn.execute('UPDATE issues SET status = ? WHERE id = ?', (status, issue_id))
+        return self.get_issue(issue_id)
+
+    def resolve_issue(self, issue_id, date):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE issues SET status = 'resolved', resolved_date = ? WHERE id = ? AND status != 'resolved'",
+                (date, issue_id)
+            )
+            return cursor.rowcount > 0
+
+    def get_issue(self, issue_id):
+        row = self.connection().execute('SELECT * FROM issues WHERE id = ?', (issue_id,)).fetchone()
+        return self._with_updates([row])[0] if row else None
+
+    def _patient_filter(self, patient, since=None, until=None):
+        where = 'patient_key = ?'
+        params = [patient.lower()]
+        if since:
+            where += ' AND date >= ?'
+            params.append(since)
+        if until:
+            where += ' AND date <= ?'
+            params.append(until)
+        return where, params
+
+    def patient_issues(self, patient, since=None, until=None):
+        # Served from the (patient_key, date) index, already in date order
+        where, params = self._patient_filter(patient, since, until)
+        rows = self.connection().execute(f'SELECT * FROM issues WHERE {where} ORDER BY date, id', params).fetchall()
+        return self._with_updates(rows)
+
+    def issue_counts(self, patient, since=None, until=None):
+        where, params = self._patient_filter(patient, since, until)
+        rows = self.connection().execute(f'SELECT status, COUNT(*) AS n FROM issues WHERE {where} GROUP BY status', params)
+        return {row['status']: row['n'] for row in rows}
+
+    def _iter_issues(self, where, params, batch):
+        cursor = self.connection().execute(f'SELECT * FROM issues WHERE {where} ORDER BY date, id', params)
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return
+            yield from self._with_updates(rows)
+
+    def iter_patient_issues(self, patient, since=None, until=None, batch=200):
+        # Like patient_issues, but streams the rows a page at a time for long histories
+        where, params = self._patient_filter(patient, since, until)
+        return self._iter_issues(where, params, batch)
+
+    def iter_issues(self, batch=200):
+        return self._iter_issues('1 = 1', [], batch)
+
+    def open_issues(self):
+        rows = self.connection().execute("SELECT * FROM issues WHERE status != 'resolved' ORDER BY date, id").fetchall()
+        return self._with_updates(rows)
+
+    def _with_updates(self, rows):
+        issues = []
+        by_id = {}
+        for row in rows:
+            issue = {
+                'id': row['id'],
+                'patient': row['patient'],
+                'description': row['description'],
+                'status': row['status'],
+                'date': row['date'],
+                'updates': [],
+            }
+            if row['resolved_date']:
+                issue['resolved_date'] = row['resolved_date']
+            issues.append(issue)
+            by_id[row['id']] = issue
+        if by_id:
+            conn = self.connection()
+            ids = list(by_id)
+            # Chunk the IN list to stay under SQLite's parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                for update in conn.execute(
+                        f'SELECT issue_id, date, update_text FROM issue_updates WHERE issue_id IN ({placeholders}) ORDER BY id',
+                        batch):
+                    by_id[update['issue_id']]['updates'].append({'date': update['date'], 'update': update['update_text']})
+        return issues
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM issue_updates')
+            conn.execute('DELETE FROM issues')
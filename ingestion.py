@@ -0,0 +1,207 @@
+"""Background research ingestion: extract, summarize and index new files without blocking the server."""
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from extraction import extract_text, file_hash
+from locks import file_lock
+from storage import atomic_write_json
+
+RESEARCH_EXTENSIONS = ('.pdf', '.txt')
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+class IngestionQueue:
+    def __init__(self, research_dir, processed_dir, summary_file, manifest_file, summarize,
+                 on_document=None, on_complete=None, extract=None, extract_workers=2, summarize_workers=2,
+                 on_start=None, lock_file=None):
+        self.research_dir = research_dir
+        self.processed_dir = processed_dir
+        self.summary_file = summary_file
+        self.manifest_file = manifest_file
+        self.summarize = summarize
+        # extract(path, digest) -> text; defaults to in-process extraction
+        self.extract = extract or (lambda path, digest: extract_text(path))
+        self.on_document = on_document
+        self.on_complete = on_complete
+        self.on_start = on_start
+        # Scans in different worker processes take turns on this lock and re-read each other's results
+        self.lock_file = lock_file or os.path.join(research_dir, '.ingest.lock')
+        self.extract_workers = extract_workers
+        self.summarize_workers = summarize_workers
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.summaries = load_json(summary_file, {})
+        # sha256 of file content -> {"file": name, "status": "summarized"}
+        self.manifest = load_json(manifest_file, {})
+        self.state = {
+            'status': 'idle',
+            'queued': 0,
+            'in_progress': [],
+            'completed': 0,
+            'skipped': 0,
+            'failed': {},
+            'documents': {},   # file -> latest summarization progress and cost report
+            'last_started': None,
+            'last_finished': None,
+        }
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='ingestion', daemon=True)
+            self.thread.start()
+
+    def enqueue(self):
+        # Ask for a scan of the research folder; scans run one at a time in the background
+        with self.lock:
+            self.state['queued'] += 1
+        self.jobs.put('scan')
+        return self.status()
+
+    def status(self):
+        with self.lock:
+            status = dict(self.state)
+            status['in_progress'] = list(self.state['in_progress'])
+            status['failed'] = dict(self.state['failed'])
+            status['documents'] = {file: dict(report) for file, report in self.state['documents'].items()}
+            status['summaries'] = len(self.summaries)
+        return status
+
+    def _run(self):
+        while True:
+            self.jobs.get()
+            with self.lock:
+                self.state['queued'] -= 1
+                self.state['status'] = 'running'
+                self.state['last_started'] = time.strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                with file_lock(self.lock_file):
+                    self._reload()
+                    if self.on_start:
+                        self.on_start()
+                    self.scan()
+                    if self.on_complete:
+                        self.on_complete(dict(self.summaries))
+            except Exception as e:
+                print(f"[Moira] Research ingestion failed: {e}")
+            with self.lock:
+                self.state['status'] = 'idle'
+                self.state['in_progress'] = []
+                self.state['last_finished'] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _reload(self):
+        summaries = load_json(self.summary_file, {})
+        manifest = load_json(self.manifest_file, {})
+        with self.lock:
+            self.summaries = summaries
+            self.manifest = manifest
+
+    def _seed_manifest(self):
+        # Files summarized before hashes were tracked are recognised by their processed copy
+        known = {entry['file'] for entry in self.manifest.values()}
+        changed = False
+        for file in os.listdir(self.processed_dir):
+            if file in self.summaries and file not in known:
+                self.manifest[file_hash(os.path.join(self.processed_dir, file))] = {'file': file, 'status': 'summarized'}
+                changed = True
+        if changed:
+            atomic_write_json(self.manifest_file, self.manifest, indent=2)
+
+    def scan(self):
+        self._seed_manifest()
+        pending = []
+        seen = set()
+        for file in sorted(os.listdir(self.research_dir)):
+            path = os.path.join(self.research_dir, file)
+            if not file.endswith(RESEARCH_EXTENSIONS) or not os.path.isfile(path):
+                continue
+            digest = file_hash(path)
+            if digest in self.manifest or digest in seen:
+                # Same content already ingested or queued (possibly under another name)
+                self._finish(file, path)
+                with self.lock:
+                    self.state['skipped'] += 1
+                continue
+            seen.add(digest)
+            pending.append((file, path, digest))
+        if not pending:
+            return
+        with self.lock:
+            self.state['in_progress'] = [file for file, _, _ in pending]
+        # Extraction and summarization overlap: each document is summarized as soon as its text is ready
+        with ThreadPoolExecutor(max_workers=self.extract_workers, thread_name_prefix='extract') as extractors, \
+                ThreadPoolExecutor(max_workers=self.summarize_workers, thread_name_prefix='summarize') as summarizers:
+            extracting = {extractors.submit(self.extract, path, digest): (file, path, digest)
+                          for file, path, digest in pending}
+            summarizing = {}
+            for future in as_completed(extracting):
+                file, path, digest = extracting[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    self._fail(file, e)
+                    continue
+                if not content.strip():
+                    self._fail(file, 'no text could be extracted')
+                    continue
+                summarizing[summarizers.submit(self._summarize, file, content)] = (file, path, digest, content)
+            for future in as_completed(summarizing):
+                file, path, digest, content = summarizing[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    self._fail(file, e)
+                    continue
+                self._record(file, path, digest, content, summary)
+
+    def _summarize(self, file, content):
+        def progress(report):
+            with self.lock:
+                self.state['documents'][file] = report
+
+        with metrics.span('summarize'):
+            return self.summarize(content, name=file, progress=progress)
+
+    def _record(self, file, path, digest, content, summary):
+        with self.lock:
+            self.summaries[file] = summary
+            self.manifest[digest] = {'file': file, 'status': 'summarized'}
+            atomic_write_json(self.summary_file, self.summaries, indent=2)
+            atomic_write_json(self.manifest_file, self.manifest, indent=2)
+            self.state['completed'] += 1
+            self.state['failed'].pop(file, None)
+        if self.on_document:
+            self.on_document(file, path, content, summary)
+        self._finish(file, path)
+
+    def _fail(self, file, error):
+        print(f"[Moira] Failed to summarize {file}: {error}")
+        with self.lock:
+            self.state['failed'][file] = str(error)
+            if file in self.state['in_progress']:
+                self.state['in_progress'].remove(file)
+
+    def _finish(self, file, path):
+        # Move processed file to processed dir
+        try:
+            shutil.move(path, os.path.join(self.processed_dir, file))
+        except OSError as e:
+            print(f"[Moira] Could not move {file} to processed: {e}")
+        with self.lock:
+            if file in self.state['in_progress']:
+                self.state['in_progress'].remove(file)
@@ -0,0 +1,230 @@
+"""Incremental transcription of audio uploaded in chunks while the user is still speaking."""
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+
+from transcriber import SAMPLE_RATE
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy comes with local Whisper; without it only whole-clip transcription is offered
+    np = None
+
+# Decodes a growing webm/ogg stream from stdin into 16 kHz mono PCM on stdout as it arrives
+DECODER_COMMAND = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', 'pipe:0',
+                   '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(SAMPLE_RATE), 'pipe:1']
+READ_SIZE = 3200  # 100 ms of 16-bit samples
+
+
+class EnergyVAD:
+    # Splits a sample stream into speech segments at pauses, comparing frame RMS with an adaptive noise floor
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=30, threshold=0.01, silence_ms=500, min_speech_ms=240,
+                 max_segment_s=25, padding_ms=210):
+        self.frame = sample_rate * frame_ms // 1000
+        self.threshold = threshold
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        # Whisper works on 30 s windows, so long monologues are cut before that
+        self.max_frames = int(max_segment_s * 1000 // frame_ms)
+        self.preroll = deque(maxlen=max(1, padding_ms // frame_ms))
+        self.noise_floor = None
+        self.pending = np.zeros(0, np.float32)
+        self.frames = []
+        self.speech_frames = 0
+        self.silent_run = 0
+
+    def _is_speech(self, frame):
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        if rms > max(self.threshold, (self.noise_floor or 0.0) * 3):
+            return True
+        self.noise_floor = rms if self.noise_floor is None else 0.95 * self.noise_floor + 0.05 * rms
+        return False
+
+    def _cut(self):
+        frames, speech = self.frames, self.speech_frames
+        self.frames, self.speech_frames, self.silent_run = [], 0, 0
+        if speech < self.min_speech_frames:
+            return None
+        return np.concatenate(frames)
+
+    def feed(self, samples):
+        # Returns the segments these samples completed
+        data = np.concatenate([self.pending, samples])
+        usable = len(data) // self.frame * self.frame
+        self.pending = data[usable:]
+        segments = []
+        for start in range(0, usable, self.frame):
+            frame = data[start:start + self.frame]
+            speech = self._is_speech(frame)
+            if not self.frames:
+                if speech:
+                    # Keep a little audio from before the onset so first syllables aren't clipped
+                    self.frames = list(self.preroll) + [frame]
+                    self.preroll.clear()
+                    self.speech_frames = 1
+                else:
+                    self.preroll.append(frame)
+                continue
+            self.frames.append(frame)
+            if speech:
+                self.speech_frames += 1
+                self.silent_run = 0
+            else:
+                self.silent_run += 1
+            if self.silent_run >= self.silence_frames or len(self.frames) >= self.max_frames:
+                segment = self._cut()
+                if segment is not None:
+                    segments.append(segment)
+        return segments
+
+    def flush(self):
+        if self.frames and len(self.pending):
+            self.frames.append(self.pending)
+        self.pending = np.zeros(0, np.float32)
+        return self._cut()
+
+
+class LiveSession:
+    def __init__(self, session_id, submit, vad, decoder_command=DECODER_COMMAND):
+        # submit(samples) queues one segment on the Whisper worker and returns a future for its text
+        self.id = session_id
+        self.submit = submit
+        self.vad = vad
+        self.segments = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.next_seq = 0
+        self.closed = False
+        self.updated = time.time()
+        self.process = subprocess.Popen(decoder_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self.reader = threading.Thread(target=self._read, name=f'live-transcribe-{session_id[:8]}', daemon=True)
+        self.reader.start()
+
+    def _queue(self, samples):
+        future = self.submit(samples)
+        with self.lock:
+            self.segments.append(future)
+
+    def _read(self):
+        # Decoded audio goes through the VAD as it arrives; each finished segment is transcribed straight away
+        rest = b''
+        while True:
+            data = self.process.stdout.read1(READ_SIZE)
+            if not data:
+                break
+            data = rest + data
+            usable = len(data) // 2 * 2
+            rest = data[usable:]
+            samples = np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+            for segment in self.vad.feed(samples):
+                self._queue(segment)
+        segment = self.vad.flush()
+        if segment is not None:
+            self._queue(segment)
+
+    def feed(self, data, seq=None):
+        # Chunks must arrive in order; seq lets a retried or reordered upload be refused instead of garbling audio
+        with self.write_lock:
+            with self.lock:
+                if self.closed:
+                    raise ValueError("session already finished")
+                if seq is not None and seq != self.next_seq:
+                    raise ValueError(f"expected chunk {self.next_seq}, got {seq}")
+                self.next_seq += 1
+                self.updated = time.time()
+            try:
+                self.process.stdin.write(data)
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                raise ValueError("audio decoder stopped")
+
+    def partial(self):
+        # Text of the segments transcribed so far, in order, up to the first one still running
+        with self.lock:
+            futures = list(self.segments)
+        texts = []
+        for future in futures:
+            if not future.done():
+                break
+            if future.exception() is None and future.result():
+                texts.append(future.result())
+        return ' '.join(texts), len(futures)
+
+    def _close_input(self):
+        with self.write_lock:
+            with self.lock:
+                self.closed = True
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def finish(self, timeout=120):
+        # Ends the audio, transcribes whatever speech is left and returns the whole text
+        deadline = time.time() + timeout
+        self._close_input()
+        self.reader.join(max(0, deadline - time.time()))
+        if self.reader.is_alive():
+            self.abort()
+            raise TimeoutError("audio decoder did not finish")
+        self.process.wait()
+        with self.lock:
+            futures = list(self.segments)
+        texts = [future.result(timeout=max(0, deadline - time.time())) for future in futures]
+        return ' '.join(text for text in texts if text)
+
+    def abort(self):
+        self._close_input()
+        if self.process.poll() is None:
+            self.process.kill()
+        for future in self.segments:
+            future.cancel()
+
+
+class LiveTranscriber:
+    # Open sessions live in the process that created them; a chunk reaching another worker gets a 404 and the
+    # client falls back to uploading the whole clip
+    def __init__(self, worker, idle_timeout=60, decoder_command=DECODER_COMMAND, **vad_options):
+        self.worker = worker
+        self.idle_timeout = idle_timeout
+        self.decoder_command = decoder_command
+        self.vad_options = vad_options
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return np is not None and bool(shutil.which(self.decoder_command[0])) and self.worker.available
+
+    def _expire(self):
+        now = time.time()
+        with self.lock:
+            stale = [s for s in self.sessions.values() if now - s.updated > self.idle_timeout]
+            for session in stale:
+                del self.sessions[session.id]
+        for session in stale:
+            session.abort()
+
+    def open(self):
+        self._expire()
+        session = LiveSession(uuid.uuid4().hex, self.worker.submit, EnergyVAD(**self.vad_options), self.decoder_command)
+        with self.lock:
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.sessions)}
@@ -0,0 +1,82 @@
+"""Cross-process file locks for shared data files and for electing the process that runs background jobs."""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl (Windows): only single-process serving is supported, so locks always succeed
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    # Yields True if the lock is held; with blocking=False yields False when another process holds it
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class LeaderLock:
+    # The process holding this lock runs the scheduler and startup ingestion; the OS releases it if that
+    # process dies, and a waiting process takes over on its next attempt
+    def __init__(self, path, retry_interval=30):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.fd = None
+        self.thread = None
+
+    @property
+    def is_leader(self):
+        return self.fd is not None
+
+    def try_acquire(self):
+        if self.fd is not None:
+            return True
+        if fcntl is None:
+            self.fd = -1
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+
+    def start(self, on_elected):
+        # Calls on_elected() once, in this thread if the lock is free now, otherwise when it is won later
+        if self.try_acquire():
+            on_elected()
+            return True
+
+        def wait():
+            while not self.try_acquire():
+                time.sleep(self.retry_interval)
+            print(f"[Moira] Process {os.getpid()} took over background jobs")
+            on_elected()
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=wait, name='leader-election', daemon=True)
+            self.thread.start()
+        return False
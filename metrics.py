@@ -0,0 +1,225 @@
+"""In-process counters, histograms and per-request stage spans, exported in Prometheus text format."""
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+slow_request_seconds = None  # set via configure(); None disables the slow-request log
+_local = threading.local()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in key) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, series):
+                    out.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), count))
+                out.append((f"{self.name}_bucket", key + (('le', '+Inf'),), series[-1]))
+                out.append((f"{self.name}_sum", key, round(series[-2], 6)))
+                out.append((f"{self.name}_count", key, series[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        # collect() -> [(name, kind, help, labels, value)] read at scrape time (e.g. cache stats)
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for collect in self.collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"[Moira] Metrics collector failed: {e}")
+                continue
+            described = set()
+            for name, kind, help, labels, value in samples:
+                if name not in described:
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    described.add(name)
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.register(Counter('moira_requests_total', 'Requests handled, by endpoint.'))
+REQUEST_ERRORS = REGISTRY.register(Counter('moira_request_errors_total', 'Requests that failed, by endpoint.'))
+REQUEST_SECONDS = REGISTRY.register(Histogram('moira_request_seconds', 'End-to-end request latency, by endpoint.'))
+STAGE_SECONDS = REGISTRY.register(Histogram('moira_stage_seconds', 'Latency of each request and ingestion stage.'))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram('moira_upstream_seconds', 'Latency of calls to OpenAI, ElevenLabs and Whisper.'))
+UPSTREAM_ERRORS = REGISTRY.register(Counter('moira_upstream_errors_total', 'Failed upstream calls, by service.'))
+CACHE_REQUESTS = REGISTRY.register(Counter('moira_cache_requests_total', 'Cache lookups, by cache and result.'))
+LLM_TOKENS = REGISTRY.register(Counter('moira_llm_tokens_total', 'Tokens reported by OpenAI, by purpose and kind.'))
+PROMPT_TOKENS = REGISTRY.register(Histogram('moira_prompt_tokens', 'Estimated prompt tokens per chat request, by section.',
+                                            TOKEN_BUCKETS))
+PROMPT_DROPPED = REGISTRY.register(Counter('moira_prompt_dropped_total', 'History turns and research passages left out of prompts to fit the budget.'))
+
+
+def configure(slow_request_ms=None):
+    global slow_request_seconds
+    slow_request_seconds = slow_request_ms / 1000.0 if slow_request_ms else None
+
+
+def render():
+    return REGISTRY.render()
+
+
+def record_tokens(usage, purpose):
+    # usage is the OpenAI response.usage object (may be missing on streamed or faked responses)
+    if usage is None:
+        return
+    for kind in ('prompt', 'completion'):
+        value = getattr(usage, f"{kind}_tokens", None)
+        if value:
+            LLM_TOKENS.inc(value, purpose=purpose, kind=kind)
+
+
+class Trace:
+    # Collects the stage timings of one request; a trace can be re-entered, e.g. inside a streaming generator
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = []
+        self.notes = {}
+        self.failed = False
+        self.finished = False
+        self.previous = []
+
+    def __enter__(self):
+        self.previous.append(getattr(_local, 'trace', None))
+        _local.trace = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.failed = True
+        _local.trace = self.previous.pop()
+        return False
+
+    def fail(self):
+        self.failed = True
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.started
+        REQUESTS.inc(endpoint=self.endpoint)
+        REQUEST_SECONDS.observe(elapsed, endpoint=self.endpoint)
+        if self.failed:
+            REQUEST_ERRORS.inc(endpoint=self.endpoint)
+        if slow_request_seconds is not None and elapsed >= slow_request_seconds:
+            breakdown = ' '.join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages)
+            notes = ''.join(f" {key}={value}" for key, value in self.notes.items())
+            print(f"[Moira] Slow request {self.endpoint} {elapsed * 1000:.0f}ms: {breakdown or 'no stages recorded'}{notes}")
+
+
+def note(**fields):
+    # Extra detail for the current request's slow-request log line
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.notes.update(fields)
+
+
+@contextmanager
+def request(endpoint):
+    trace = Trace(endpoint)
+    try:
+        with trace:
+            yield trace
+    finally:
+        trace.finish()
+
+
+@contextmanager
+def span(stage, upstream=None):
+    # Times one stage; upstream names the external service the stage waits on
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if upstream:
+            UPSTREAM_ERRORS.inc(service=upstream)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if upstream:
+            UPSTREAM_SECONDS.observe(elapsed, service=upstream)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.stages.append((stage, elapsed))
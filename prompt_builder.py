@@ -0,0 +1,128 @@
+"""Token-budgeted prompt assembly for ask_moira."""
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    # tiktoken is optional; fall back to a character-based estimate
+    _encoding = None
+
+MESSAGE_OVERHEAD = 4  # role/format tokens per chat message
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip() + '…'
+    return text[:max_tokens * 4].rstrip() + '…'
+
+
+class PromptBuilder:
+    # Sections are trimmed lowest priority first: research, family context, the long-term summary, then the oldest history
+    def __init__(self, system_prompt, context_window=8192, reply_tokens=500, research_tokens=1200,
+                 family_tokens=400, history_tokens=2000, turn_tokens=400, summary_tokens=400):
+        self.prefix = {"role": "system", "content": system_prompt}
+        self.prefix_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD
+        self.context_window = context_window
+        self.reply_tokens = reply_tokens
+        self.research_tokens = research_tokens
+        self.family_tokens = family_tokens
+        self.history_tokens = history_tokens
+        self.turn_tokens = turn_tokens
+        self.summary_tokens = summary_tokens
+
+    def _research_message(self, passages, budget):
+        lines = []
+        used = count_tokens("Here is some relevant research context:\n") + MESSAGE_OVERHEAD
+        dropped = 0
+        for passage in passages:
+            line = f"[{passage['source'].split(':', 1)[-1]}] {passage['text']}"
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                dropped += 1
+                continue
+            lines.append(line)
+            used += cost
+        if not lines:
+            return None, 0, dropped
+        content = "Here is some relevant research context:\n" + "\n\n".join(lines)
+        return {"role": "system", "content": content}, used, dropped
+
+    def _context_message(self, header, text, budget):
+        if not text:
+            return None, 0
+        overhead = count_tokens(header) + MESSAGE_OVERHEAD
+        if budget <= overhead:
+            return None, 0
+        content = header + truncate_to_tokens(text, budget - overhead)
+        return {"role": "system", "content": content}, count_tokens(content) + MESSAGE_OVERHEAD
+
+    def _family_message(self, family_context, budget):
+        return self._context_message("The family you are supporting:\n", family_context, budget)
+
+    def _history_messages(self, history, budget):
+        # Newest turns are kept first; long past answers are shortened to turn_tokens each
+        kept = []
+        used = 0
+        for conv in reversed(history):
+            user = truncate_to_tokens(conv["user"], self.turn_tokens // 2)
+            assistant = truncate_to_tokens(conv["assistant"], self.turn_tokens)
+            cost = count_tokens(user) + count_tokens(assistant) + 2 * MESSAGE_OVERHEAD
+            if used + cost > budget:
+                break
+            kept.append((user, assistant))
+            used += cost
+        messages = []
+        for user, assistant in reversed(kept):
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        return messages, used, len(history) - len(kept)
+
+    def build(self, user_input, passages=(), family_context='', history=(), summary=''):
+        user_tokens = count_tokens(user_input) + MESSAGE_OVERHEAD
+        available = self.context_window - self.reply_tokens - self.prefix_tokens - user_tokens
+        # History is highest priority after the question itself, then the long-term summary, family, research
+        history_messages, history_used, turns_dropped = self._history_messages(
+            history, max(0, min(self.history_tokens, available)))
+        available -= history_used
+        summary_message, summary_used = self._context_message(
+            "Summary of your earlier conversations with this family:\n", summary,
+            max(0, min(self.summary_tokens, available)))
+        available -= summary_used
+        family_message, family_used = self._family_message(family_context, max(0, min(self.family_tokens, available)))
+        available -= family_used
+        research_message, research_used, passages_dropped = self._research_message(
+            passages, max(0, min(self.research_tokens, available)))
+
+        messages = [self.prefix]
+        if family_message:
+            messages.append(family_message)
+        if research_message:
+            messages.append(research_message)
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(history_messages)
+        messages.append({"role": "user", "content": user_input})
+        usage = {
+            'system': self.prefix_tokens,
+            'family': family_used,
+            'research': research_used,
+            'summary': summary_used,
+            'history': history_used,
+            'user': user_tokens,
+            'total': self.prefix_tokens + family_used + research_used + summary_used + history_used + user_tokens,
+            'budget': self.context_window - self.reply_tokens,
+            'dropped_turns': turns_dropped,
+            'dropped_passages': passages_dropped,
+        }
+        return messages, usage
@@ -0,0 +1,263 @@
+"""Local BM25 retrieval index over Moira's research library."""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+INDEX_FORMAT = 1
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = {
+    'a', 'about', 'after', 'all', 'also', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'been', 'being',
+    'but', 'by', 'can', 'could', 'did', 'do', 'does', 'for', 'from', 'had', 'has', 'have', 'he', 'her',
+    'his', 'how', 'i', 'if', 'in', 'into', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'our', 'she',
+    'so', 'some', 'such', 'than', 'that', 'the', 'their', 'them', 'then', 'there', 'these', 'they',
+    'this', 'those', 'to', 'was', 'we', 'were', 'what', 'when', 'which', 'who', 'will', 'with', 'would',
+    'you', 'your'
+}
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 30
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English prose
+    return max(1, len(text) // 4)
+
+
+def chunk_text(text, max_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    # Pack whole paragraphs into chunks, windowing any paragraph that is too long on its own
+    chunks = []
+    current = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if len(words) > max_words:
+            if current:
+                chunks.append(' '.join(current))
+                current = []
+            step = max_words - overlap
+            for start in range(0, len(words), step):
+                chunks.append(' '.join(words[start:start + max_words]))
+                if start + max_words >= len(words):
+                    break
+            continue
+        if len(current) + len(words) > max_words and current:
+            chunks.append(' '.join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+class ResearchIndex:
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self.version = 0
+        self.saved_version = 0
+        self.last_save = 0.0
+        self.next_id = 0
+        self.sources = {}   # source -> {"fingerprint": ..., "kind": ..., "chunks": [ids]}
+        self.chunks = {}    # chunk id -> {"source", "kind", "text", "length", "tf"}
+        self.postings = {}  # term -> {chunk id: term frequency}
+        self.total_length = 0
+        self.loaded_mtime = None
+        self.last_check = 0.0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Moira] Research index unreadable, rebuilding: {e}")
+            return
+        if data.get('format') != INDEX_FORMAT:
+            return
+        with self.lock:
+            self.version = data.get('version', 0)
+            self.next_id = data.get('next_id', 0)
+            self.sources = data.get('sources', {})
+            self.chunks = {int(cid): chunk for cid, chunk in data.get('chunks', {}).items()}
+            self.postings = {}
+            self.total_length = 0
+            for cid, chunk in self.chunks.items():
+                self._post(cid, chunk)
+            self.saved_version = self.version
+            self.loaded_mtime = mtime
+
+    def reload_if_changed(self, force=False, interval=2.0):
+        # Picks up an index saved by another worker process; stats the file at most every `interval` seconds
+        now = time.monotonic()
+        if not force and now - self.last_check < interval:
+            return False
+        if self.dirty:
+            # Loading now would drop documents indexed here that haven't been saved yet
+            return False
+        self.last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.loaded_mtime:
+            return False
+        self.load()
+        return True
+
+    @property
+    def dirty(self):
+        return self.version != self.saved_version
+
+    def save(self):
+        # Chunks and source entries are replaced, never changed in place, so a shallow copy taken under the lock
+        # can be written out while searches carry on
+        with self.save_lock:
+            with self.lock:
+                version = self.version
+                data = {
+                    'format': INDEX_FORMAT,
+                    'version': version,
+                    'next_id': self.next_id,
+                    'sources': dict(self.sources),
+                    'chunks': dict(self.chunks),
+                }
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+            self.loaded_mtime = os.stat(self.path).st_mtime_ns
+            self.saved_version = version
+            self.last_save = time.monotonic()
+
+    def save_if_dirty(self, interval=0):
+        # Writes the index only when it changed, and at most once per `interval` seconds
+        if not self.dirty or time.monotonic() - self.last_save < interval:
+            return False
+        self.save()
+        return True
+
+    def _post(self, cid, chunk):
+        for term, tf in chunk['tf'].items():
+            self.postings.setdefault(term, {})[cid] = tf
+        self.total_length += chunk['length']
+
+    def _unpost(self, cid, chunk):
+        for term in chunk['tf']:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(cid, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= chunk['length']
+
+    def fingerprint(self, source):
+        entry = self.sources.get(source)
+        return entry['fingerprint'] if entry else None
+
+    def add_document(self, source, text, kind='fulltext', fingerprint=None):
+        # Returns False when the source is already indexed with the same fingerprint
+        if fingerprint is not None and self.fingerprint(source) == fingerprint:
+            return False
+        # Chunking and tokenizing happen before the lock is taken, so searches only wait for the merge
+        chunks = []
+        for piece in chunk_text(text):
+            terms = tokenize(piece)
+            if terms:
+                chunks.append({
+                    'source': source,
+                    'kind': kind,
+                    'text': piece,
+                    'length': len(terms),
+                    'tf': dict(Counter(terms)),
+                })
+        with self.lock:
+            if fingerprint is not None and self.fingerprint(source) == fingerprint:
+                return False
+            self._remove(source)
+            ids = []
+            for chunk in chunks:
+                cid = self.next_id
+                self.next_id += 1
+                self.chunks[cid] = chunk
+                self._post(cid, chunk)
+                ids.append(cid)
+            self.sources[source] = {'fingerprint': fingerprint, 'kind': kind, 'chunks': ids}
+            self.version += 1
+            return True
+
+    def _remove(self, source):
+        entry = self.sources.pop(source, None)
+        if not entry:
+            return False
+        for cid in entry['chunks']:
+            chunk = self.chunks.pop(cid, None)
+            if chunk:
+                self._unpost(cid, chunk)
+        return True
+
+    def remove_document(self, source):
+        with self.lock:
+            if self._remove(source):
+                self.version += 1
+                return True
+            return False
+
+    def search(self, query, k=5, token_budget=1200):
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.chunks)
+            if not terms or not n:
+                return []
+            avg_length = self.total_length / n
+            scores = Counter()
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for cid, tf in docs.items():
+                    length = self.chunks[cid]['length']
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[cid] += idf * tf * (self.k1 + 1) / norm
+            results = []
+            used = 0
+            for cid, score in scores.most_common():
+                if len(results) >= k:
+                    break
+                chunk = self.chunks[cid]
+                cost = estimate_tokens(chunk['text'])
+                if used + cost > token_budget:
+                    continue
+                used += cost
+                results.append({
+                    'source': chunk['source'],
+                    'kind': chunk['kind'],
+                    'text': chunk['text'],
+                    'score': round(score, 3),
+                })
+            return results
+
+    def stats(self):
+        with self.lock:
+            return {
+                'version': self.version,
+                'sources': len(self.sources),
+                'chunks': len(self.chunks),
+                'terms': len(self.postings),
+            }
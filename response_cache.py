@@ -0,0 +1,111 @@
+"""Opt-in cache of model answers for repeated questions, keyed on the question and the context it was answered in."""
+import hashlib
+import re
+import threading
+import time
+
+from storage import SQLiteStore
+
+# Questions that lean on the conversation so far can't be answered from a cached reply
+CONTEXT_REFERENCE_RE = re.compile(
+    r"\b(you (said|mentioned|suggested|told|recommended)|earlier|last time|before|again|"
+    r"tell me more|more about|what about|instead|that|this|it|those|these|them|he|she|they|him|her)\b",
+    re.IGNORECASE
+)
+PRE_QUESTION_RE = re.compile(r'<button class="pre-question">(.*?)</button>', re.DOTALL)
+
+
+def normalize_question(text):
+    text = re.sub(r"[^\w\s']", ' ', text.lower())
+    return ' '.join(text.split())
+
+
+def references_conversation(text):
+    return bool(CONTEXT_REFERENCE_RE.search(text))
+
+
+def canned_questions(template_path):
+    # The pre-question buttons on the home page
+    try:
+        with open(template_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+    except OSError:
+        return []
+    return [' '.join(q.split()) for q in PRE_QUESTION_RE.findall(html)]
+
+
+class ResponseCache(SQLiteStore):
+    # Kept in SQLite so every worker process shares the answers, including the canned ones warmed by the leader
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS answers (
+            key TEXT PRIMARY KEY,
+            answer TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            used_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS answers_used_at ON answers (used_at);
+    '''
+    SYNCHRONOUS = 'NORMAL'
+
+    def __init__(self, path, ttl=86400, max_entries=256):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, question, research_version, family_context, summary=''):
+        # The long-term summary is part of every prompt, so an answer is only reused while it is unchanged
+        family = hashlib.sha1(family_context.encode('utf-8')).hexdigest()
+        summary = hashlib.sha1(summary.encode('utf-8')).hexdigest()
+        raw = f"{normalize_question(question)}\0{research_version}\0{family}\0{summary}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT answer, stored_at FROM answers WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row['stored_at'] > self.ttl:
+                if row is not None:
+                    conn.execute('DELETE FROM answers WHERE key = ?', (key,))
+                answer = None
+            else:
+                conn.execute('UPDATE answers SET used_at = ? WHERE key = ?', (now, key))
+                answer = row['answer']
+        with self.lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def put(self, key, answer):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO answers (key, answer, stored_at, used_at) VALUES (?, ?, ?, ?)',
+                         (key, answer, now, now))
+            # Least recently used answers go first
+            conn.execute('DELETE FROM answers WHERE key IN '
+                         '(SELECT key FROM answers ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def contains(self, key):
+        row = self.connection().execute('SELECT stored_at FROM answers WHERE key = ?', (key,)).fetchone()
+        return row is not None and time.time() - row['stored_at'] <= self.ttl
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM answers')
+
+    def stats(self):
+        entries = self.connection().execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
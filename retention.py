@@ -0,0 +1,192 @@
+"""Age, count and size limits for Moira's generated files, applied off the request path with a dry-run report."""
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from locks import file_lock
+
+DAY = 86400
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class Policy:
+    # Files in directory matching pattern are kept to max_age_days / max_files / max_bytes, oldest removed first;
+    # files older than compress_after_days are gzipped in place (never within a day of their last write)
+    def __init__(self, name, directory, pattern, max_age_days=None, max_files=None, max_bytes=None,
+                 compress_after_days=None):
+        self.name = name
+        self.directory = directory
+        self.pattern = re.compile(pattern)
+        self.max_age_days = max_age_days
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.compress_after_days = compress_after_days
+
+    def describe(self):
+        limits = []
+        if self.max_age_days is not None:
+            limits.append(f"{self.max_age_days:g} day{'s' if self.max_age_days != 1 else ''}")
+        if self.max_files is not None:
+            limits.append(f"{self.max_files} files")
+        if self.max_bytes is not None:
+            limits.append(format_bytes(self.max_bytes))
+        if self.compress_after_days is not None:
+            limits.append(f"gzip after {self.compress_after_days:g} day{'s' if self.compress_after_days != 1 else ''}")
+        return ', '.join(limits) or 'no limits'
+
+    def scan(self):
+        # (mtime, size, path) for each matching file, oldest first
+        files = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return files
+        for name in names:
+            if not self.pattern.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def plan(self, now=None):
+        # Returns [(action, path, size)] with action 'delete' or 'compress'
+        now = now or time.time()
+        files = self.scan()
+        actions = []
+        kept = []
+        for mtime, size, path in files:
+            if self.max_age_days is not None and now - mtime > self.max_age_days * DAY:
+                actions.append(('delete', path, size))
+            else:
+                kept.append((mtime, size, path))
+        total = sum(size for _, size, _ in kept)
+        while kept and ((self.max_files is not None and len(kept) > self.max_files)
+                        or (self.max_bytes is not None and total > self.max_bytes)):
+            mtime, size, path = kept.pop(0)
+            total -= size
+            actions.append(('delete', path, size))
+        if self.compress_after_days is not None:
+            age = max(self.compress_after_days, 1) * DAY
+            for mtime, size, path in kept:
+                if not path.endswith('.gz') and now - mtime > age:
+                    actions.append(('compress', path, size))
+        return actions
+
+
+def compress_file(path):
+    # Writes path.gz beside the original (keeping its mtime, so age limits still apply), then removes the original;
+    # readers see the plain file or the finished .gz, never a partial one
+    directory = os.path.dirname(path) or '.'
+    stat = os.stat(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.gz')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9,
+                                                       mtime=stat.st_mtime) as out, open(path, 'rb') as f:
+            shutil.copyfileobj(f, out, 1 << 20)
+        os.utime(tmp, (stat.st_atime, stat.st_mtime))
+        os.replace(tmp, path + '.gz')
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.remove(path)
+    return os.path.getsize(path + '.gz')
+
+
+class Retention:
+    def __init__(self, policies, lock_file=None):
+        self.policies = policies
+        self.lock_file = lock_file
+
+    def plan(self, now=None):
+        return {policy.name: policy.plan(now) for policy in self.policies}
+
+    def run(self, dry_run=False, now=None):
+        # Returns {policy: {'deleted', 'compressed', 'reclaimed', 'actions'}}; reclaimed bytes for compression are
+        # estimated in a dry run
+        if self.lock_file and not dry_run:
+            with file_lock(self.lock_file, blocking=False) as locked:
+                if not locked:
+                    print("[Moira] Retention already running in another process")
+                    return {}
+                return self._run(dry_run, now)
+        return self._run(dry_run, now)
+
+    def _run(self, dry_run, now):
+        report = {}
+        for name, actions in self.plan(now).items():
+            result = {'deleted': 0, 'compressed': 0, 'reclaimed': 0, 'actions': actions}
+            for action, path, size in actions:
+                try:
+                    if action == 'delete':
+                        if not dry_run:
+                            os.remove(path)
+                        result['deleted'] += 1
+                        result['reclaimed'] += size
+                    else:
+                        # Text logs typically shrink to about a fifth
+                        compressed = size // 5 if dry_run else compress_file(path)
+                        result['compressed'] += 1
+                        result['reclaimed'] += max(0, size - compressed)
+                except OSError as e:
+                    print(f"[Moira] Retention could not {action} {path}: {e}")
+            report[name] = result
+        return report
+
+
+def summarize(report, dry_run=False):
+    verb = 'would reclaim' if dry_run else 'reclaimed'
+    parts = [f"{name}: {r['deleted']} deleted, {r['compressed']} compressed, {verb} {format_bytes(r['reclaimed'])}"
+             for name, r in report.items() if r['deleted'] or r['compressed']]
+    return '; '.join(parts) or 'nothing to reclaim'
+
+
+def env_limit(name, suffix, default, cast=int):
+    # MOIRA_RETENTION_<NAME>_<SUFFIX>; an empty value or 0 turns the limit off
+    value = os.getenv(f"MOIRA_RETENTION_{name.upper()}_{suffix}")
+    if value is None:
+        return default
+    value = cast(value) if value.strip() else 0
+    return value or None
+
+
+def default_policies(documents_dir='documents', logs_dir='logs', archive_dir='memory/archive',
+                     text_cache_dir='research/text_cache'):
+    def policy(name, directory, pattern, days=None, files=None, mb=None, compress=None):
+        max_mb = env_limit(name, 'MB', mb, float)
+        return Policy(
+            name, directory, pattern,
+            max_age_days=env_limit(name, 'DAYS', days, float),
+            max_files=env_limit(name, 'FILES', files),
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+            compress_after_days=env_limit(name, 'COMPRESS_DAYS', compress, float),
+        )
+
+    return [
+        # Generated summaries, schedules and exports; they can always be generated again
+        policy('documents', documents_dir, r'^(?!\.).+\.txt$', days=90, files=200, mb=50),
+        # Daily logs are the full conversation record, so by default they are only compressed
+        policy('logs', logs_dir, r'^\d{4}-\d{2}-\d{2}\.txt(?:\.gz)?$', compress=7),
+        policy('log_summaries', os.path.join(logs_dir, 'summaries'), r'^\d{4}-\d{2}-\d{2}\.txt$'),
+        policy('archive', archive_dir, r'^[^.].*\.json$'),
+        # Plain copies of extracted text left by older versions; the .txt.gz they came from is kept
+        policy('text_cache', text_cache_dir, r'^[0-9a-f]{64}\.txt$', days=7),
+        # Temp files left by a crash part way through an atomic write
+        policy('documents_tmp', documents_dir, r'^\.tmp-', days=1),
+    ]
@@ -0,0 +1,213 @@
+"""Full-text search over past conversations, health notes and family profiles, kept current as they change."""
+import hashlib
+import os
+import re
+
+from storage import SQLiteStore
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+KINDS = ('conversation', 'summary', 'health', 'family')
+
+
+def turn_ref(timestamp, user):
+    # The same key whether a turn is indexed live or re-read from its day log, so neither path duplicates it
+    return f"turn:{timestamp}:{hashlib.sha1(user.encode('utf-8')).hexdigest()[:12]}"
+
+
+def match_query(text, any_term=False):
+    # Free text -> an FTS5 query of quoted terms, so user punctuation can't be read as query syntax
+    terms = TERM_RE.findall(text.lower())
+    if not terms:
+        return None
+    return (' OR ' if any_term else ' ').join(f'"{term}"' for term in terms)
+
+
+def flatten(value):
+    if isinstance(value, dict):
+        return '\n'.join(f"{key}: {flatten(v)}" for key, v in value.items() if v)
+    if isinstance(value, (list, tuple)):
+        return ', '.join(flatten(v) for v in value if v)
+    return str(value)
+
+
+class SearchIndex(SQLiteStore):
+    # entries holds one row per searchable item; entries_fts is an external-content FTS5 index kept in step by triggers
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            ref TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            date TEXT,
+            title TEXT NOT NULL DEFAULT '',
+            body TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_kind_date ON entries (kind, date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            title, body, content='entries', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+            INSERT INTO entries_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+        END;
+    '''
+
+    def _upsert(self, conn, ref, kind, date, title, body):
+        # Unchanged rows are left alone so a resync doesn't rewrite the FTS index
+        conn.execute(
+            '''INSERT INTO entries (ref, kind, date, title, body) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(ref) DO UPDATE SET kind = excluded.kind, date = excluded.date,
+                   title = excluded.title, body = excluded.body
+               WHERE entries.title != excluded.title OR entries.body != excluded.body
+                   OR entries.date IS NOT excluded.date''',
+            (ref, kind, date, title or '', body or '')
+        )
+
+    def _replace_kind(self, conn, kind, refs):
+        # Drops rows of this kind whose source no longer exists
+        rows = conn.execute('SELECT id, ref FROM entries WHERE kind = ?', (kind,)).fetchall()
+        stale = [(row['id'],) for row in rows if row['ref'] not in refs]
+        conn.executemany('DELETE FROM entries WHERE id = ?', stale)
+
+    def index_turn(self, timestamp, user, assistant):
+        with self.transaction() as conn:
+            self._upsert(conn, turn_ref(timestamp, user), 'conversation', timestamp, user, assistant)
+
+    def sync_logs(self, daily_logs):
+        # Re-reads only the day logs whose size or mtime changed since they were last indexed
+        dates = set(daily_logs.dates_between('0000-00-00', '9999-99-99'))
+        indexed = {row['key'][4:]: row['value'] for row in
+                   self.connection().execute("SELECT key, value FROM meta WHERE key LIKE 'log:%'")}
+        changed = 0
+        for date_str in sorted(dates):
+            path = daily_logs.existing_path(date_str)
+            try:
+                stat = os.stat(path)
+            except (OSError, TypeError):
+                continue
+            version = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if indexed.get(date_str) == version:
+                continue
+            entries = daily_logs.entries_for_day(date_str)
+            with self.transaction() as conn:
+                for entry in entries:
+                    self._upsert(conn, turn_ref(entry['timestamp'], entry['user']), 'conversation',
+                                 entry['timestamp'], entry['user'], entry['assistant'])
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (f"log:{date_str}", version))
+            changed += 1
+        for date_str in set(indexed) - dates:
+            # The day's log was removed, so its turns go from the index too
+            with self.transaction() as conn:
+                conn.execute("DELETE FROM entries WHERE kind = 'conversation' AND date >= ? AND date < ?",
+                             (date_str, date_str + '~'))
+                conn.execute('DELETE FROM meta WHERE key = ?', (f"log:{date_str}",))
+            changed += 1
+        return changed
+
+    def sync_turns(self, turns):
+        # Turns in the conversation store; rows already read from a day log keep their ref, and nothing is removed
+        # here since compacted turns stay searchable through their logs
+        with self.transaction() as conn:
+            for turn in turns:
+                self._upsert(conn, turn_ref(turn['timestamp'], turn['user']), 'conversation',
+                             turn['timestamp'], turn['user'], turn['assistant'])
+
+    def sync_summaries(self, summaries):
+        with self.transaction() as conn:
+            refs = set()
+            for s in summaries:
+                ref = f"summary:{s['id']}"
+                refs.add(ref)
+                self._upsert(conn, ref, 'summary', s['end_time'], f"{s['start_time']} to {s['end_time']}", s['summary'])
+            self._replace_kind(conn, 'summary', refs)
+
+    def _issue_row(self, issue):
+        lines = [issue['description']]
+        lines.extend(f"Update ({u['date']}): {u['update']}" for u in issue.get('updates') or [])
+        if issue.get('resolved_date'):
+            lines.append(f"Resolved on {issue['resolved_date']}")
+        return f"health:{issue['id']}", 'health', issue['date'], f"{issue['patient']} ({issue['status']})", '\n'.join(lines)
+
+    def index_issue(self, issue):
+        with self.transaction() as conn:
+            self._upsert(conn, *self._issue_row(issue))
+
+    def sync_issues(self, issues):
+        with self.transaction() as conn:
+            refs = set()
+            for issue in issues:
+                row = self._issue_row(issue)
+                refs.add(row[0])
+                self._upsert(conn, *row)
+            self._replace_kind(conn, 'health', refs)
+
+    def sync_profiles(self, profiles):
+        with self.transaction() as conn:
+            refs = set()
+            for profile in profiles:
+                if not profile.get('name'):
+                    continue
+                ref = f"family:{profile['name'].strip().lower()}"
+                refs.add(ref)
+                body = flatten({k: v for k, v in profile.items() if k != 'name'})
+                self._upsert(conn, ref, 'family', None, profile['name'], body)
+            self._replace_kind(conn, 'family', refs)
+
+    def search(self, query, kinds=None, page=1, per_page=10, newest_first=False, exclude_title=None):
+        # Ranked by BM25 (matches in the title count double) or by date; all terms must match, falling back to
+        # any term when that finds nothing. Rows whose title exclude_title(title) accepts are left out of the
+        # results and the total
+        conn = self.connection()
+        terms = TERM_RE.findall(query.lower())
+        result = {'query': query, 'page': page, 'per_page': per_page, 'total': 0, 'results': []}
+        if not terms:
+            return result
+        for any_term in (False, True):
+            where = 'entries_fts MATCH ?'
+            params = [match_query(query, any_term)]
+            if kinds:
+                where += f" AND e.kind IN ({', '.join('?' * len(kinds))})"
+                params.extend(kinds)
+            if exclude_title:
+                conn.create_function('excluded_title', 1, lambda title: int(bool(exclude_title(title))),
+                                     deterministic=True)
+                where += ' AND NOT excluded_title(e.title)'
+            total = conn.execute(
+                f'SELECT COUNT(*) FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid WHERE {where}', params
+            ).fetchone()[0]
+            if total or len(terms) == 1:
+                break
+        result['total'] = total
+        result['matched'] = 'any' if any_term else 'all'
+        if not total:
+            return result
+        order = 'e.date DESC, e.id DESC' if newest_first else 'score'
+        rows = conn.execute(
+            f'''SELECT e.ref, e.kind, e.date, e.title,
+                       snippet(entries_fts, 1, '[', ']', '…', 16) AS snippet,
+                       bm25(entries_fts, 2.0, 1.0) AS score
+                FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+                WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?''',
+            params + [per_page, (page - 1) * per_page]
+        ).fetchall()
+        result['results'] = [
+            {'ref': row['ref'], 'kind': row['kind'], 'date': row['date'], 'title': row['title'],
+             'snippet': row['snippet'], 'score': round(-row['score'], 3)}
+            for row in rows
+        ]
+        return result
+
+    def stats(self):
+        rows = self.connection().execute('SELECT kind, COUNT(*) AS n FROM entries GROUP BY kind')
+        return {row['kind']: row['n'] for row in rows}
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM entries')
+            conn.execute("DELETE FROM meta WHERE key LIKE 'log:%'")
@@ -29,6 +29,91 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    function playAudio(url) {
+        const audio = document.createElement('audio');
+        audio.src = url;
+        audio.style.display = 'none'; // Hide the player
+        document.body.appendChild(audio); // Attach to DOM so it can play
+        audio.play();
+
+        // Stop previous audio if needed
+        if (currentAudio && currentAudio !== audio) {
+            currentAudio.pause();
+            currentAudio.remove();
+        }
+        currentAudio = audio;
+
+        // Remove audio element after playback
+        audio.addEventListener('ended', () => {
+            audio.remove();
+        });
+    }
+
+    async function fetchDeferredAudio(statusUrl) {
+        // Long-poll until the background audio job finishes
+        for (let attempt = 0; attempt < 10; attempt++) {
+            const resp = await fetch(statusUrl + '?wait=20');
+            if (resp.status === 200) {
+                const data = await resp.json();
+                if (data.audio_url) playAudio(data.audio_url);
+                return;
+            }
+            if (resp.status !== 202) {
+                console.warn('Audio job ' + statusUrl + ' returned ' + resp.status);
+                return;
+            }
+        }
+        console.warn('Audio job ' + statusUrl + ' did not finish');
+    }
+
+    async function sendMessageWithoutStreaming(message) {
+        const response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ message })
+        });
+        const data = await response.json();
+        if (data.error) {
+            addMessage('Error: ' + data.error);
+            return;
+        }
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message assistant';
+        const messageText = document.createElement('span');
+        messageText.innerHTML = linkify(data.response);
+        messageDiv.appendChild(messageText);
+        chatMessages.appendChild(messageDiv);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+        // Text arrives first; the speech follows once the server has made it
+        if (data.audio_url) {
+            playAudio(data.audio_url);
+        } else if (data.audio_status_url) {
+            fetchDeferredAudio(data.audio_status_url);
+        }
+    }
+
+    function handleStreamEvent(event, messageText, state) {
+        if (event.type === 'audio_stream') {
+            // Sentences are synthesized while the text streams, so start playback right away
+            state.audioUrl = event.url;
+            playAudio(event.url);
+        } else if (event.type === 'token') {
+            state.text += event.text;
+            messageText.textContent = state.text;
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        } else if (event.type === 'done') {
+            // Swap in the linkified text once the full reply is known
+            messageText.innerHTML = linkify(event.response);
+            if (event.audio_url && event.audio_url !== state.audioUrl) {
+                playAudio(event.audio_url);
+            }
+        } else if (event.type === 'error') {
+            messageText.textContent = state.text + '\n\nError: ' + event.error;
+        }
+    }
+
     async function sendMessage() {
         const message = userInput.value.trim();
         if (!message) return;
@@ -38,7 +123,12 @@ document.addEventListener('DOMContentLoaded', () => {
         userInput.value = '';
 
         try {
-            const response = await fetch('/api/chat', {
+            if (!window.ReadableStream || !window.TextDecoder) {
+                await sendMessageWithoutStreaming(message);
+                return;
+            }
+
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -46,44 +136,43 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({ message })
             });
 
-            const data = await response.json();
-            
-            if (data.error) {
-                addMessage('Error: ' + data.error);
+            if (!response.ok) {
+                const data = await response.json();
+                addMessage('Error: ' + (data.error || response.statusText));
                 return;
             }
 
-            // Add assistant's response
+            // Add assistant's response and fill it in as tokens arrive
             const messageDiv = document.createElement('div');
             messageDiv.className = 'message assistant';
             
             const messageText = document.createElement('span');
-            messageText.innerHTML = linkify(data.response);
             messageDiv.appendChild(messageText);
+            chatMessages.appendChild(messageDiv);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
 
-            // Add audio player if audio URL is provided
-            if (data.audio_url) {
-                const audio = document.createElement('audio');
-                audio.src = data.audio_url;
-                audio.style.display = 'none'; // Hide the player
-                document.body.appendChild(audio); // Attach to DOM so it can play
-                audio.play();
-
-                // Stop previous audio if needed
-                if (currentAudio && currentAudio !== audio) {
-                    currentAudio.pause();
-                    currentAudio.remove();
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            const state = { text: '', audioUrl: null };
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                // Server-Sent Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    const data = rawEvent.split('\n')
+                        .filter(line => line.startsWith('data: '))
+                        .map(line => line.slice(6))
+                        .join('\n');
+                    if (data) {
+                        handleStreamEvent(JSON.parse(data), messageText, state);
+                    }
                 }
-                currentAudio = audio;
-
-                // Remove audio element after playback
-                audio.addEventListener('ended', () => {
-                    audio.remove();
-                });
             }
-
-            chatMessages.appendChild(messageDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
         } catch (error) {
             addMessage('Error: Could not send message. Please try again.');
             console.error('Error:', error);
@@ -114,6 +203,66 @@ document.addEventListener('DOMContentLoaded', () => {
         userInput.style.height = userInput.scrollHeight + 'px';
     });
 
+    // Audio is uploaded in slices while recording so finished phrases are transcribed before release
+    const CHUNK_MS = 250;
+    let liveSession = null;
+
+    function startLiveSession() {
+        const session = { id: null, seq: 0 };
+        session.uploads = fetch('/api/transcribe/stream', { method: 'POST' })
+            .then(async resp => {
+                if (!resp.ok) return false;
+                session.id = (await resp.json()).session_id;
+                return true;
+            })
+            .catch(() => false);
+        return session;
+    }
+
+    function uploadChunk(session, chunk) {
+        // One upload at a time, in order; the partial transcript is shown as it comes back
+        const seq = session.seq++;
+        session.uploads = session.uploads.then(async ok => {
+            if (!ok) return false;
+            try {
+                const resp = await fetch(`/api/transcribe/stream/${session.id}?seq=${seq}`, {
+                    method: 'POST',
+                    body: chunk
+                });
+                if (!resp.ok) return false;
+                const data = await resp.json();
+                if (data.partial) userInput.value = data.partial;
+                return true;
+            } catch (err) {
+                return false;
+            }
+        });
+    }
+
+    async function finishLiveSession(session) {
+        // Returns null if streaming wasn't possible, so the caller can send the whole clip instead
+        if (!session || !(await session.uploads)) return null;
+        try {
+            const resp = await fetch(`/api/transcribe/stream/${session.id}/finish`, { method: 'POST' });
+            if (!resp.ok) return null;
+            const data = await resp.json();
+            return data.text;
+        } catch (err) {
+            return null;
+        }
+    }
+
+    async function transcribeClip(audioBlob) {
+        const formData = new FormData();
+        formData.append('audio', audioBlob, 'input.webm');
+        const resp = await fetch('/api/transcribe', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await resp.json();
+        return data.text;
+    }
+
     if (pressToTalkBtn) {
         pressToTalkBtn.addEventListener('mousedown', async () => {
             pressToTalkBtn.classList.add('active');
@@ -125,24 +274,26 @@ document.addEventListener('DOMContentLoaded', () => {
                     const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
                     mediaRecorder = new MediaRecorder(stream);
                     mediaRecorder.ondataavailable = (e) => {
-                        if (e.data.size > 0) audioChunks.push(e.data);
+                        if (e.data.size > 0) {
+                            audioChunks.push(e.data);
+                            if (liveSession) uploadChunk(liveSession, e.data);
+                        }
                     };
                     mediaRecorder.onstop = async () => {
                         pressToTalkBtn.classList.remove('active', 'ready');
                         clearTimeout(holdTimeout);
+                        const session = liveSession;
+                        liveSession = null;
                         if (audioChunks.length > 0) {
                             const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
                             audioChunks = [];
-                            // Send audio to backend for transcription
-                            const formData = new FormData();
-                            formData.append('audio', audioBlob, 'input.webm');
-                            const resp = await fetch('/api/transcribe', {
-                                method: 'POST',
-                                body: formData
-                            });
-                            const data = await resp.json();
-                            if (data.text) {
-                                userInput.value = data.text;
+                            let text = await finishLiveSession(session);
+                            if (text === null) {
+                                // Send the whole clip to the backend for transcription
+                                text = await transcribeClip(audioBlob);
+                            }
+                            if (text) {
+                                userInput.value = text;
                                 sendMessage();
                             }
                         }
@@ -155,7 +306,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             }
             audioChunks = [];
-            mediaRecorder.start();
+            liveSession = startLiveSession();
+            mediaRecorder.start(CHUNK_MS);
         });
         ['mouseup', 'mouseleave', 'touchend'].forEach(evt => {
             pressToTalkBtn.addEventListener(evt, () => {
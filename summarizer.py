@@ -0,0 +1,149 @@
+"""Map-reduce summarization of whole research documents, with chunk summaries cached by content hash."""
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from prompt_builder import count_tokens
+from storage import SQLiteStore
+
+DOCUMENT_PROMPT = "Summarize this document to help support an autistic child. Be clear and gentle."
+CHUNK_PROMPT = ("Summarize this section of a research document for a parent of an autistic child. "
+                "Keep findings, practical strategies and any cautions. Be concise.")
+REDUCE_PROMPT = ("These are summaries of consecutive sections of one research document. "
+                 "Combine them into one concise summary, keeping findings, strategies and cautions.")
+
+
+def split_into_chunks(text, chunk_tokens):
+    # Paragraphs are packed into chunks of about chunk_tokens; oversized paragraphs are split on sentences, then words
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= chunk_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            if count_tokens(sentence) <= chunk_tokens:
+                pieces.append(sentence)
+                continue
+            words = sentence.split()
+            step = max(1, chunk_tokens // 2)
+            pieces.extend(' '.join(words[i:i + step]) for i in range(0, len(words), step))
+    chunks, current, used = [], [], 0
+    for piece in pieces:
+        cost = count_tokens(piece)
+        if current and used + cost > chunk_tokens:
+            chunks.append('\n\n'.join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += cost
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+class ChunkSummaryCache(SQLiteStore):
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS chunk_summaries (
+            key TEXT PRIMARY KEY,
+            summary TEXT NOT NULL
+        );
+    '''
+
+    def get(self, key):
+        row = self.connection().execute('SELECT summary FROM chunk_summaries WHERE key = ?', (key,)).fetchone()
+        return row['summary'] if row else None
+
+    def put(self, key, summary):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO chunk_summaries (key, summary) VALUES (?, ?)', (key, summary))
+
+
+class MapReduceSummarizer:
+    def __init__(self, client, cache_path, model="gpt-3.5-turbo", chunk_tokens=3000, workers=4,
+                 price_in=0.0005, price_out=0.0015):
+        # price_in / price_out are USD per 1K prompt / completion tokens, used for the cost report
+        self.client = client
+        self.cache = ChunkSummaryCache(cache_path)
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.price_in = price_in
+        self.price_out = price_out
+        # One pool shared by every document, so concurrent ingestion can't multiply the request rate
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summarize-chunk')
+
+    def _call(self, prompt, text, max_tokens, stats):
+        key = hashlib.sha256(f"{self.model}\0{prompt}\0{max_tokens}\0{text}".encode('utf-8')).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            metrics.CACHE_REQUESTS.inc(cache='chunk_summary', result='hit')
+            with stats['lock']:
+                stats['cached'] += 1
+            return cached
+        metrics.CACHE_REQUESTS.inc(cache='chunk_summary', result='miss')
+        with metrics.span('summarize_chunk', upstream='openai'):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": text}
+                ],
+                max_tokens=max_tokens
+            )
+        usage = getattr(response, 'usage', None)
+        metrics.record_tokens(usage, 'research_summary')
+        summary = response.choices[0].message.content.strip()
+        self.cache.put(key, summary)
+        with stats['lock']:
+            stats['prompt_tokens'] += getattr(usage, 'prompt_tokens', 0) or 0
+            stats['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+        return summary
+
+    def _report(self, stats, progress):
+        if progress is None:
+            return
+        with stats['lock']:
+            report = {k: v for k, v in stats.items() if k != 'lock'}
+        report['cost_usd'] = round(report['prompt_tokens'] / 1000 * self.price_in
+                                   + report['completion_tokens'] / 1000 * self.price_out, 4)
+        progress(report)
+
+    def _map(self, prompt, chunks, max_tokens, stats, progress):
+        futures = [self.pool.submit(self._call, prompt, chunk, max_tokens, stats) for chunk in chunks]
+        results = []
+        for future in futures:
+            results.append(future.result())
+            with stats['lock']:
+                stats['done'] += 1
+            self._report(stats, progress)
+        return results
+
+    def summarize(self, text, name=None, progress=None):
+        # progress(report) is called as chunks finish with counts, tokens and the running cost
+        chunks = split_into_chunks(text, self.chunk_tokens)
+        stats = {'lock': threading.Lock(), 'stage': 'map', 'chunks': len(chunks), 'done': 0, 'cached': 0,
+                 'prompt_tokens': 0, 'completion_tokens': 0}
+        if len(chunks) <= 1:
+            stats['stage'] = 'reduce'
+            summary = self._call(DOCUMENT_PROMPT, chunks[0] if chunks else text, 500, stats)
+        else:
+            partials = self._map(CHUNK_PROMPT, chunks, 300, stats, progress)
+            stats['stage'] = 'reduce'
+            # Reduce in rounds until the partial summaries fit in one request
+            while count_tokens('\n\n'.join(partials)) > self.chunk_tokens:
+                groups = split_into_chunks('\n\n'.join(partials), self.chunk_tokens)
+                with stats['lock']:
+                    stats['chunks'] += len(groups)
+                partials = self._map(REDUCE_PROMPT, groups, 400, stats, progress)
+            summary = self._call(DOCUMENT_PROMPT, '\n\n'.join(partials), 500, stats)
+        stats['done'] = stats['chunks']
+        stats['stage'] = 'done'
+        self._report(stats, progress)
+        cost = stats['prompt_tokens'] / 1000 * self.price_in + stats['completion_tokens'] / 1000 * self.price_out
+        print(f"[Moira] Summarized {name or 'document'}: {len(chunks)} chunks ({stats['cached']} cached), "
+              f"{stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens, ~${cost:.4f}")
+        return summary
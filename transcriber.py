@@ -0,0 +1,133 @@
+"""Long-lived local Whisper transcription worker."""
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+
+SAMPLE_RATE = 16000
+
+# Each worker thread (or process) keeps its own loaded model here
+_local = threading.local()
+
+
+def decode_audio(data, sample_rate=SAMPLE_RATE):
+    # Decode any ffmpeg-readable container (webm/ogg/wav/mp3) from memory into mono float32 samples
+    import numpy as np
+    proc = subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', '0', '-i', 'pipe:0',
+         '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), 'pipe:1'],
+        input=data, capture_output=True, check=False
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode audio: {proc.stderr.decode(errors='ignore').strip()}")
+    return np.frombuffer(proc.stdout, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def _load_model(model_size):
+    model = getattr(_local, 'model', None)
+    if model is None:
+        import whisper
+        model = whisper.load_model(model_size)
+        _local.model = model
+    return model
+
+
+def _warm_up(model_size):
+    _load_model(model_size)
+    return True
+
+
+def _transcribe(model_size, data):
+    model = _load_model(model_size)
+    samples = decode_audio(data) if isinstance(data, (bytes, bytearray)) else data
+    if not len(samples):
+        return ''
+    result = model.transcribe(samples, fp16=False)
+    return result['text'].strip()
+
+
+class TranscriptionWorker:
+    def __init__(self, model_size='base', concurrency=1, use_process=False):
+        self.model_size = model_size
+        self.concurrency = max(1, concurrency)
+        self.use_process = use_process
+        self.status = 'stopped'
+        self.error = None
+        self.ready = threading.Event()
+        self.executor = None
+        self.pending = 0
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Load the model(s) in the background so the first request does not pay for it
+        if self.executor is not None:
+            return
+        try:
+            import whisper  # noqa: F401  (fail fast if the local model isn't installed)
+        except Exception as e:
+            self.status = 'unavailable'
+            self.error = str(e)
+            print(f"[Moira] Local Whisper unavailable: {e}")
+            return
+        if self.use_process:
+            self.executor = ProcessPoolExecutor(max_workers=self.concurrency,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='whisper')
+        self.status = 'loading'
+        started = time.time()
+        warmups = [self.executor.submit(_warm_up, self.model_size) for _ in range(self.concurrency)]
+
+        def wait_for_warmup():
+            try:
+                for future in warmups:
+                    future.result()
+            except Exception as e:
+                self.status = 'unavailable'
+                self.error = str(e)
+                print(f"[Moira] Failed to load Whisper model '{self.model_size}': {e}")
+                return
+            self.status = 'ready'
+            self.loaded_at = time.time()
+            print(f"[Moira] Whisper model '{self.model_size}' ready in {self.loaded_at - started:.1f}s")
+            self.ready.set()
+
+        threading.Thread(target=wait_for_warmup, daemon=True).start()
+
+    @property
+    def available(self):
+        return self.status in ('loading', 'ready')
+
+    def submit(self, data):
+        # Queues one transcription and returns its future; data is raw encoded audio or float32 samples
+        if not self.available:
+            raise RuntimeError(f"Local transcription unavailable: {self.error}")
+        with self.lock:
+            self.pending += 1
+        try:
+            future = self.executor.submit(_transcribe, self.model_size, data)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def transcribe(self, data, timeout=120):
+        return self.submit(data).result(timeout=timeout)
+
+    def health(self):
+        return {
+            'status': self.status,
+            'ready': self.ready.is_set(),
+            'model': self.model_size,
+            'mode': 'process' if self.use_process else 'thread',
+            'concurrency': self.concurrency,
+            'queue_depth': self.pending,
+            'error': self.error,
+        }
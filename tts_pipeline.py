@@ -0,0 +1,207 @@
+"""Sentence-pipelined text-to-speech: synthesize replies sentence by sentence and stream the audio in order."""
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# A sentence ends at . ! ? (optionally followed by closing quotes/brackets) and whitespace, or at a blank line
+SENTENCE_END_RE = re.compile(r'[.!?]+["\')\]]*\s+|\n\s*\n')
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz) used by the fake backend
+SILENT_MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+JOB_TTL_SECONDS = 600
+
+
+class SentenceSplitter:
+    def __init__(self, min_chars=20):
+        # Very short fragments ("Oh." "Yes!") are merged with the next sentence to save TTS round trips
+        self.min_chars = min_chars
+        self.buffer = ''
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(self.buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            sentences.append(self.buffer[start:match.end()].strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ''
+        return [rest] if rest else []
+
+
+class ElevenLabsBackend:
+    def __init__(self, voice, model="eleven_flash_v2"):
+        self.voice = voice
+        self.model = model
+
+    def synthesize(self, text):
+        from elevenlabs import generate
+        return generate(text=text, voice=self.voice, model=self.model)
+
+
+class FakeTTSBackend:
+    # Local stand-in for ElevenLabs: sleeps for a configurable latency and returns silent MP3 frames
+    def __init__(self, latency=0.0, per_char_latency=0.0):
+        self.latency = latency
+        self.per_char_latency = per_char_latency
+        self.voice = 'fake'
+        self.model = 'fake'
+        self.calls = 0
+
+    def synthesize(self, text):
+        self.calls += 1
+        time.sleep(self.latency + self.per_char_latency * len(text))
+        # Roughly 26ms of audio per frame, about 15 characters per second of speech
+        return SILENT_MP3_FRAME * max(1, len(text) * 3)
+
+
+class SpeechJob:
+    def __init__(self, pipeline, clean=None):
+        self.id = uuid.uuid4().hex
+        self.pipeline = pipeline
+        self.clean = clean
+        self.splitter = SentenceSplitter()
+        self.futures = []
+        self.closed = False
+        self.created = time.time()
+        self.cond = threading.Condition()
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(text):
+            self._submit(sentence)
+
+    def close(self):
+        for sentence in self.splitter.flush():
+            self._submit(sentence)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.pipeline.store:
+            self.pipeline.store.update(self.id, status='done', finished=time.time())
+
+    def _submit(self, sentence):
+        if self.clean:
+            sentence = self.clean(sentence).strip()
+        if not sentence:
+            return
+        with self.cond:
+            seq = len(self.futures)
+            if self.pipeline.store:
+                self.pipeline.store.add_part(self.id, seq)
+            future = self.pipeline.executor.submit(self.pipeline.synthesize_part, self.id, seq, sentence)
+            self.futures.append(future)
+            self.cond.notify_all()
+
+    def iter_audio(self, idle_timeout=60):
+        # Yield each sentence's audio in order as soon as it (and everything before it) is ready
+        index = 0
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(lambda: index < len(self.futures) or self.closed, timeout=idle_timeout):
+                    return
+                if index >= len(self.futures):
+                    return
+                future = self.futures[index]
+            index += 1
+            try:
+                audio = future.result(timeout=idle_timeout)
+            except Exception as e:
+                print(f"[Moira] Sentence synthesis failed: {e}")
+                continue
+            if audio:
+                yield audio
+
+
+class SpeechPipeline:
+    def __init__(self, backend, max_workers=3, cache=None, store=None):
+        # With a cache and a shared job store (audio_jobs.AudioJobStore), a job's audio can be streamed by any worker
+        # process: each finished sentence is recorded with its cache file
+        self.backend = backend
+        self.cache = cache
+        self.store = store if cache is not None else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def synthesize(self, sentence):
+        return self._synthesize(sentence)[1]
+
+    def _synthesize(self, sentence):
+        if self.cache is None:
+            return None, self.backend.synthesize(sentence)
+        filename, _ = self.cache.get_or_create(sentence, self.backend.voice, self.backend.model, self.backend.synthesize)
+        return filename, self.cache.read(filename)
+
+    def synthesize_part(self, job_id, seq, sentence):
+        filename = None
+        try:
+            filename, audio = self._synthesize(sentence)
+        finally:
+            if self.store:
+                self.store.finish_part(job_id, seq, filename)
+        return audio
+
+    def start_job(self, clean=None):
+        job = SpeechJob(self, clean=clean)
+        now = time.time()
+        with self.lock:
+            for job_id in [j for j, old in self.jobs.items() if now - old.created > JOB_TTL_SECONDS]:
+                del self.jobs[job_id]
+            self.jobs[job.id] = job
+        if self.store:
+            self.store.prune(JOB_TTL_SECONDS)
+            self.store.create(job.id, 'stream', status='running')
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def open_stream(self, job_id):
+        # Audio for a job started in this process, or one started by another worker; None if unknown
+        job = self.get_job(job_id)
+        if job:
+            return job.iter_audio()
+        if self.store and self.store.get(job_id):
+            return self._iter_stored(job_id)
+        return None
+
+    def _iter_stored(self, job_id, idle_timeout=60, poll=0.1):
+        # Follows another worker's job through the store, reading each sentence from the shared cache once it's done
+        seq = 0
+        last_progress = time.time()
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            parts = self.store.parts(job_id, seq)
+            for part in parts:
+                if part['seq'] != seq or part['status'] == 'queued':
+                    break
+                seq += 1
+                last_progress = time.time()
+                if part['status'] != 'done':
+                    continue
+                try:
+                    audio = self.cache.read(part['filename'])
+                except OSError as e:
+                    print(f"[Moira] Sentence audio missing: {e}")
+                    continue
+                if audio:
+                    yield audio
+            else:
+                # The job was read before its parts, so a closed job with nothing left has been streamed in full
+                if job['status'] != 'running':
+                    return
+            if time.time() - last_progress > idle_timeout:
+                return
+            time.sleep(poll)
@@ -0,0 +1,11 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+
+
+def create_app():
+    # Importing app builds the stores; background services start here, once per worker process
+    import app as moira
+    moira.start_services()
+    return moira.app
+
+
+app = create_app()